@@ -1,102 +1,97 @@
 # -*- coding: utf-8 -*-
 
-import os
+import atexit
 import json
+import os
+import signal
+import sys
 import threading
 import time
 import schedule
-from flask import Flask, render_template, jsonify, request, Response
-from collections import deque
-import queue
+from flask import Flask, render_template, jsonify, request, Response, stream_with_context
 import core
+import config_store
+import events
+import jobs
+import metrics
+import providers
 import notifications  # <-- IMPORT THE NEW MODULE
 
 # --- Setup de la aplicación ---
 app = Flask(__name__)
 
 # --- Sistema de Mensajería Interno ---
-message_queue = queue.Queue()
-log_history = deque(maxlen=1000)
+# Cada cliente SSE tiene su propio buffer acotado; el historial de logs se reenvía al conectar.
+event_broadcaster = events.EventBroadcaster()
 
 # --- Funciones de Configuración ---
-def load_config():
-    """Carga la config desde el archivo y la fusiona con variables de entorno."""
-    try:
-        with open("config.json", "r") as f:
-            config = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        config = {}
-
-    # --- Start of default values ---
-    defaults = {
-        "search_paths": [], "languages": [], "schedule_enabled": False,
-        "schedule_interval_minutes": 60,
-        "min_file_size_mb": 50,
-        "max_concurrent_workers": 2,
-        "credentials": {
-            "opensubtitles": {"username": "", "password": ""},
-            "opensubtitlescom": {"username": "", "password": "", "api_key": ""},
-            "addic7ed": {"username": "", "password": ""}
-        },
-        "notifications": {
-            "enabled": False, "webhook_url": "", "notify_on_start": True,
-            "notify_on_completion": True, "notify_on_errors": True,
-            "include_errors": True, "webhook_type": "auto"
-        }
-    }
-    # --- End of default values ---
-
-
-    for key, value in defaults.items():
-        if key not in config:
-            config[key] = value
-        elif isinstance(value, dict):
-            for sub_key in value:
-                if sub_key not in config.get(key, {}):
-                    config[key][sub_key] = value[sub_key]
-
-    # Merge environment variables into credentials
-    creds = config['credentials']
-
-    # OpenSubtitles (legacy) environment variables
-    creds['opensubtitles']['username'] = os.environ.get('OPENSUBTITLES_USERNAME', creds.get('opensubtitles', {}).get('username', ''))
-    creds['opensubtitles']['password'] = os.environ.get('OPENSUBTITLES_PASSWORD', creds.get('opensubtitles', {}).get('password', ''))
+# config.json se lee una sola vez y solo se vuelve a leer si cambia en disco o se guarda desde /config.
+settings = config_store.ConfigStore()
 
-    # OpenSubtitles.com environment variables
-    creds['opensubtitlescom']['username'] = os.environ.get('OPENSUBTITLESCOM_USERNAME', creds.get('opensubtitlescom', {}).get('username', ''))
-    creds['opensubtitlescom']['password'] = os.environ.get('OPENSUBTITLESCOM_PASSWORD', creds.get('opensubtitlescom', {}).get('password', ''))
-    creds['opensubtitlescom']['api_key'] = os.environ.get('OPENSUBTITLESCOM_APIKEY', creds.get('opensubtitlescom', {}).get('api_key', ''))
-
-    # Addic7ed environment variables
-    creds['addic7ed']['username'] = os.environ.get('ADDIC7ED_USERNAME', creds.get('addic7ed', {}).get('username', ''))
-    creds['addic7ed']['password'] = os.environ.get('ADDIC7ED_PASSWORD', creds.get('addic7ed', {}).get('password', ''))
-
-    return config
+def load_config():
+    """Devuelve la instantánea (inmutable) de la configuración actual."""
+    return settings.get()
 
 def save_config(new_config):
-    """Guarda la configuración en el archivo JSON."""
-    with open("config.json", "w") as f:
-        json.dump(new_config, f, indent=2)
+    """Valida y guarda la configuración; lanza config_store.ConfigError si no es válida."""
+    return settings.save(new_config)
+
+# --- Cache, índice de la biblioteca y estado persistente ---
+# Se configuran una sola vez al arrancar; cambiar la ruta del cache requiere reiniciar.
+initial_config = load_config()
+core.configure_cache(
+    initial_config['cache_path'],
+    initial_config['cache_backend'],
+    max_entries=initial_config['cache_max_entries'],
+    ttl_hours=initial_config['cache_ttl_hours']
+)
+library_index = core.open_library_index()
+# Estadísticas de salud de los proveedores, compartidas por todas las ejecuciones
+provider_manager = providers.ProviderManager(state_path=os.path.join(core.cache_path, 'provider_stats.json'))
+# Los webhooks se envían desde un hilo propio para no retrasar las descargas
+notifier = notifications.NotificationDispatcher()
+# Al salir se envían los resúmenes pendientes en lugar de perderlos
+atexit.register(notifier.close)
+# Resumen de cada ejecución (tiempos por etapa, recuentos por proveedor e idioma)
+run_history = metrics.RunHistory(os.path.join(core.cache_path, 'run_history.json'))
+# Checkpoints de las ejecuciones correctas, para las ejecuciones programadas incrementales
+LAST_RUN_CHECKPOINT = "last_run"
+LAST_FULL_SWEEP_CHECKPOINT = "last_full_sweep"
 
 # --- Lógica del Planificador y Tareas de Fondo ---
 def status_callback(message, event_type="log"):
-    """Pone actualizaciones en la cola para ser enviadas por el stream SSE."""
-    data_to_send = json.dumps({"type": event_type, "message": message})
-    message_queue.put(data_to_send)
-
-    if event_type == "log":
-        log_entry = f"[{time.strftime('%H:%M:%S')}] {message}"
-        log_history.append(log_entry)
-
-def download_task(config):
-    """La tarea de descarga que usa el callback con la cola."""
+    """Publica una actualización para todos los clientes conectados al stream SSE."""
+    event_broadcaster.publish(event_type, message)
+
+def download_task(config, changed_since=None, full_refresh=False, control=None):
+    """
+    La tarea de descarga que usa el callback con la cola.
+    Devuelve True si la ejecución terminó sin errores críticos; si el trabajo se cancela
+    propaga jobs.JobCancelled.
+    """
     print("--- BACKGROUND TASK STARTED ---")
     notif_config = config.get("notifications", {})
 
+    # Se crea aquí para poder guardar el resumen también si la ejecución se cancela o falla
+    run_metrics = metrics.RunMetrics()
+    notify_enabled = notif_config.get("enabled")
+    webhook_url = notif_config.get("webhook_url")
+    notifier.digest_interval = float(notif_config.get("digest_interval_minutes",
+                                                      notifications.DEFAULT_DIGEST_INTERVAL_MINUTES)) * 60
+
+    # Los resultados de cada vídeo se agrupan en un resumen periódico en lugar de un webhook por vídeo
+    if notify_enabled and notif_config.get("send_digest"):
+        def on_video(video_path, saved_count, error):
+            if error is None or notif_config.get("notify_on_errors"):
+                details = error if error is None or notif_config.get("include_errors") else "failed"
+                notifier.record_video(webhook_url, video_path.name, saved_count, details)
+    else:
+        on_video = None
+
     # --- NOTIFY ON START ---
-    if notif_config.get("enabled") and notif_config.get("notify_on_start"):
-        notifications.send_notification(
-            notif_config.get("webhook_url"),
+    if notify_enabled and notif_config.get("notify_on_start"):
+        notifier.notify(
+            webhook_url,
             "Subtitle download process has started.",
             title="🚀 Subtitlarr Task Started"
         )
@@ -109,50 +104,120 @@ def download_task(config):
             "addic7ed": config['credentials']['addic7ed']
         }
 
+        provider_manager.configure(
+            config.get('provider_rate_limits'),
+            config.get('provider_failure_threshold', providers.DEFAULT_FAILURE_THRESHOLD),
+            config.get('provider_cooldown_minutes', providers.DEFAULT_COOLDOWN_MINUTES)
+        )
+
         summary = core.run_downloader(
             config['search_paths'],
             config['languages'],
             credentials=prepared_credentials,
-            status_callback=status_callback
+            status_callback=status_callback,
+            max_workers=config.get('max_concurrent_workers', 2),
+            index=library_index,
+            min_file_size_mb=config.get('min_file_size_mb', 0),
+            exclude_patterns=config.get('exclude_patterns'),
+            batch_size=config.get('batch_size', core.DEFAULT_BATCH_SIZE),
+            priority=config.get('download_priority', core.DEFAULT_PRIORITY),
+            arrival_check_minutes=config.get('arrival_check_minutes', core.DEFAULT_ARRIVAL_CHECK_MINUTES),
+            probe_embedded=config.get('probe_embedded_subtitles', False),
+            changed_since=changed_since,
+            full_refresh=full_refresh,
+            provider_manager=provider_manager,
+            control=control,
+            on_video=on_video,
+            run_metrics=run_metrics
         )
+        run_history.add(summary)
         status_callback("finished", event_type="status")
         print("--- BACKGROUND TASK FINISHED ---")
 
         # --- NOTIFY ON COMPLETION ---
-        if notif_config.get("enabled") and notif_config.get("notify_on_completion"):
+        if notify_enabled and notif_config.get("notify_on_completion"):
             completion_message = (
                 f"Successfully downloaded {summary['saved_count']} new subtitle(s). "
                 f"Processed {summary['total_videos']} video files."
             )
-            notifications.send_notification(
-                notif_config.get("webhook_url"),
+            notifier.notify(
+                webhook_url,
                 completion_message,
                 title="✅ Subtitlarr Task Finished"
             )
+        return True
+
+    except jobs.JobCancelled:
+        print("--- BACKGROUND TASK CANCELLED ---")
+        run_history.add(run_metrics.summary(status='cancelled'))
+        status_callback("Task cancelled.", event_type="log")
+        status_callback("finished", event_type="status")
+        raise
 
     except Exception as e:
         print(f"--- BACKGROUND TASK FAILED: {e} ---")
+        run_history.add(run_metrics.summary(status='failed', error=str(e)))
         status_callback(f"CRITICAL ERROR: {e}", event_type="log")
         status_callback("finished", event_type="status")
 
         # --- NOTIFY ON ERROR ---
-        if notif_config.get("enabled") and notif_config.get("notify_on_errors"):
+        if notify_enabled and notif_config.get("notify_on_errors"):
             error_message = "The subtitle download process failed."
             if notif_config.get("include_errors"):
                 error_message += f"\n\n**Error Details:**\n```{e}```"
-            notifications.send_notification(
-                notif_config.get("webhook_url"),
+            notifier.notify(
+                webhook_url,
                 error_message,
                 title="❌ Subtitlarr Task Failed",
                 include_error=True
             )
+        return False
+
+
+def run_job(job):
+    """
+    Ejecuta un trabajo del JobManager con la configuración actual.
+    Si termina bien, su hora de creación pasa a ser el punto de partida de la siguiente
+    ejecución incremental (y del siguiente barrido completo, si lo era).
+    """
+    config = load_config()
+    succeeded = download_task(
+        config,
+        changed_since=job.params.get('changed_since'),
+        full_refresh=job.params.get('full_refresh', False),
+        control=job.control
+    )
+    if succeeded:
+        library_index.set_checkpoint(LAST_RUN_CHECKPOINT, job.created_at)
+        if job.params.get('full_refresh'):
+            library_index.set_checkpoint(LAST_FULL_SWEEP_CHECKPOINT, job.created_at)
+    return succeeded
 
+# Como mucho un trabajo por biblioteca; el estado se guarda para retomarlo tras un reinicio
+job_manager = jobs.JobManager(run_job, state_path=os.path.join(core.cache_path, 'jobs.json'))
 
 def scheduled_download_job():
-    """La tarea que se ejecutará según la programación."""
-    print("--- SCHEDULED TASK STARTED ---")
-    download_task(load_config())
-    print("--- SCHEDULED TASK FINISHED ---")
+    """
+    La tarea que se ejecutará según la programación.
+    En modo incremental solo procesa los vídeos añadidos o modificados desde la última
+    ejecución correcta; cada `full_scan_interval_hours` hace un barrido completo.
+    """
+    config = load_config()
+    changed_since = None
+    if config.get("incremental_schedule", True):
+        last_run = library_index.get_checkpoint(LAST_RUN_CHECKPOINT)
+        last_sweep = library_index.get_checkpoint(LAST_FULL_SWEEP_CHECKPOINT)
+        sweep_interval = float(config.get("full_scan_interval_hours", 24)) * 3600
+        if last_run and last_sweep and time.time() - last_sweep < sweep_interval:
+            changed_since = last_run
+
+    full_sweep = changed_since is None
+    params = {'full_refresh': True} if full_sweep else {'changed_since': changed_since}
+    job, created = job_manager.submit(config['search_paths'], kind='scheduled', params=params)
+    if created:
+        print(f"--- SCHEDULED TASK QUEUED: job {job.id}, {'full sweep' if full_sweep else 'incremental'} ---")
+    else:
+        print(f"--- SCHEDULED TASK SKIPPED: job {job.id} is already {job.state} for this library ---")
 
 def update_schedule(config):
     """Limpia y actualiza el planificador con la nueva configuración."""
@@ -176,39 +241,176 @@ def run_scheduler():
 @app.route('/')
 def index():
     """Página principal que muestra la interfaz y los logs históricos."""
-    return render_template('index.html', config=load_config(), logs=list(log_history))
+    history = event_broadcaster.history_snapshot()
+    last_event_id = history[-1][0] if history else 0
+    return render_template('index.html', config=load_config(), logs=[entry for _, entry in history],
+                           last_event_id=last_event_id)
 
 @app.route('/config', methods=['POST'])
 def update_config_route():
-    """Guarda la configuración y actualiza el planificador dinámicamente."""
-    new_config = request.json
-    save_config(new_config)
-    update_schedule(new_config)
+    """Guarda la configuración; el planificador se actualiza a través del listener de la config."""
+    try:
+        save_config(request.json)
+    except config_store.ConfigError as e:
+        return jsonify({'error': f'Invalid configuration: {e}'}), 400
     return jsonify({'message': 'Configuration saved successfully.'}), 200
 
+def _scan_filters():
+    """
+    Lee los filtros de /scan de la query string o del cuerpo JSON:
+    path, show, language (lista o separados por comas), missing_only, offset y limit (en carpetas).
+    """
+    params = dict(request.args.items())
+    if request.is_json and isinstance(request.json, dict):
+        params.update(request.json)
+    languages = params.get('language') or params.get('languages')
+    if isinstance(languages, str):
+        languages = [lang.strip() for lang in languages.split(',') if lang.strip()]
+    missing_only = params.get('missing_only', False)
+    if isinstance(missing_only, str):
+        missing_only = missing_only.lower() in ('1', 'true', 'yes', 'on')
+    try:
+        offset = max(0, int(params.get('offset') or 0))
+        limit = int(params['limit']) if params.get('limit') not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError('offset and limit must be integers.')
+    if limit is not None and limit < 1:
+        raise ValueError('limit must be at least 1.')
+    return {'path': params.get('path') or None, 'show': params.get('show') or None, 'languages': languages or None,
+            'missing_only': bool(missing_only), 'offset': offset, 'limit': limit}
+
 @app.route('/scan', methods=['POST'])
 def scan_route():
-    """Escanea el estado de los medios."""
+    """
+    Escanea el estado de los medios y devuelve NDJSON: una línea por carpeta en cuanto se procesa
+    (ver core.iter_media_status) y una última línea `summary` con los totales por ruta y por
+    serie/temporada/idioma de las carpetas enviadas. Con `limit` el escaneo se detiene al
+    completar la página, y `has_more` indica si quedan carpetas.
+    """
     current_config = load_config()
-    results = core.scan_media_status(current_config['search_paths'], current_config['languages'])
-    return jsonify({'results': results})
+    try:
+        filters = _scan_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    paths = list(current_config['search_paths'])
+    if filters['path']:
+        if filters['path'] not in paths:
+            return jsonify({'error': f"'{filters['path']}' is not a configured search path."}), 400
+        paths = [filters['path']]
+    languages = filters['languages'] or list(current_config['languages'])
+
+    def generate():
+        start = time.perf_counter()
+        summary = core.MediaStatusSummary(paths)
+        records = core.iter_media_status(
+            paths, languages, index=library_index,
+            min_file_size_mb=current_config.get('min_file_size_mb', 0),
+            exclude_patterns=current_config.get('exclude_patterns'),
+            show=filters['show'],
+            probe_embedded=current_config.get('probe_embedded_subtitles', False)
+        )
+        matched = 0
+        has_more = False
+        for record in records:
+            if record['type'] == 'directory' and filters['missing_only'] and not any(record['missing'].values()):
+                continue
+            if record['type'] == 'directory':
+                matched += 1
+                if matched <= filters['offset']:
+                    continue
+                if filters['limit'] is not None and matched > filters['offset'] + filters['limit']:
+                    has_more = True
+                    break
+            summary.add(record)
+            yield json.dumps(record) + "\n"
+        result = summary.result()
+        result.update({'type': 'summary', 'languages': languages, 'offset': filters['offset'],
+                       'limit': filters['limit'], 'has_more': has_more,
+                       'elapsed_seconds': round(time.perf_counter() - start, 3)})
+        yield json.dumps(result) + "\n"
+
+    # Sin buffering en proxies (nginx) para que las líneas lleguen según se generan
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/download', methods=['POST'])
 def download_route():
-    """Inicia una descarga manual en un hilo de fondo."""
+    """Encola una descarga manual; si ya hay una igual en marcha o en cola, devuelve esa."""
     current_config = load_config()
-    thread = threading.Thread(target=download_task, args=(current_config,))
-    thread.start()
-    return jsonify({'message': 'Download process started.'})
+    job, created = job_manager.submit(current_config['search_paths'], kind='manual')
+    if not created:
+        message = f'A download job is already {job.state} for this library.'
+    elif job.state == 'queued':
+        message = 'Download queued; it will start when the current job finishes.'
+    else:
+        message = 'Download process started.'
+    return jsonify({'message': message, 'created': created, 'job': job.to_dict()})
+
+@app.route('/jobs')
+def jobs_route():
+    """Trabajos activos y recientes con su progreso, velocidad y tiempo estimado."""
+    return jsonify({'jobs': job_manager.snapshot()})
+
+@app.route('/jobs/<int:job_id>/<action>', methods=['POST'])
+def job_action_route(job_id, action):
+    """Cancela, pausa o reanuda un trabajo."""
+    handlers = {'cancel': job_manager.cancel, 'pause': job_manager.pause, 'resume': job_manager.resume}
+    if action not in handlers:
+        return jsonify({'success': False, 'error': f'Unknown action: {action}'}), 404
+    job = handlers[action](job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Cannot {action} job {job_id} in its current state.'}), 409
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/providers')
+def providers_route():
+    """Estadísticas de salud de cada proveedor (latencia, errores, aciertos, circuito)."""
+    return jsonify({'providers': provider_manager.snapshot()})
+
+@app.route('/cache')
+def cache_route():
+    """Contadores de aciertos/fallos y tamaño del cache de subliminal."""
+    return jsonify(core.cache_info())
+
+@app.route('/cache/compact', methods=['POST'])
+def compact_cache_route():
+    """Elimina las entradas caducadas o sobrantes y compacta el cache en disco."""
+    try:
+        result = core.compact_cache()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    return jsonify({'success': True, **result})
 
 @app.route('/stream')
 def stream():
-    """Ruta SSE que envía mensajes desde la cola al cliente."""
-    def event_stream():
-        while True:
-            message = message_queue.get()
-            yield f"data: {message}\n\n"
-    return Response(event_stream(), mimetype='text/event-stream')
+    """
+    Ruta SSE. Reenvía los logs que el cliente no tiene (parámetro `since` o cabecera
+    Last-Event-ID al reconectar) y después los eventos nuevos.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+    try:
+        since = int(since)
+    except ValueError:
+        since = 0
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(event_broadcaster.stream(since), mimetype='text/event-stream', headers=headers)
+
+@app.route('/metrics')
+def metrics_route():
+    """Métricas acumuladas desde el arranque en el formato de texto de Prometheus."""
+    text = run_history.prometheus(provider_manager.snapshot(), core.cache_info(), notifier.metrics())
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+@app.route('/metrics/runs')
+def run_history_route():
+    """Resúmenes de las últimas ejecuciones, la más reciente primero."""
+    limit = request.args.get('limit', type=int)
+    return jsonify({'runs': run_history.recent(limit)})
+
+@app.route('/notifications')
+def notifications_route():
+    """Métricas de entrega de los webhooks (enviados, fallidos, reintentos, cola)."""
+    return jsonify(notifier.metrics())
 
 # --- NEW WEBHOOK TEST ROUTE ---
 @app.route('/test-webhook', methods=['POST'])
@@ -220,10 +422,12 @@ def test_webhook_route():
     if not webhook_url:
         return jsonify({'success': False, 'error': 'Webhook URL is required.'}), 400
 
+    # Síncrono para poder mostrar el resultado en la interfaz
     success = notifications.send_notification(
         webhook_url,
         "This is a test message from Subtitlarr!",
-        title="Webhook Test"
+        title="Webhook Test",
+        session=notifier.session
     )
 
     if success:
@@ -233,10 +437,15 @@ def test_webhook_route():
 
 
 # --- Arranque de la aplicación y el hilo del planificador ---
-initial_config = load_config()
 update_schedule(initial_config)
+# El planificador se actualiza cada vez que cambia la configuración (guardada o editada en disco)
+settings.add_listener(update_schedule)
+# Retoma los trabajos que quedaron a medias al parar la aplicación
+job_manager.resume_pending()
 scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
 scheduler_thread.start()
 
 if __name__ == '__main__':
+    # Docker para el contenedor con SIGTERM: se convierte en una salida normal para que se ejecute atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -0,0 +1,81 @@
+# subtitlarr/benchmarks/bench_walker.py
+"""
+Compares the single-pass os.scandir walker against the previous per-extension rglob walker,
+including the subtitle presence checks that scan_media_status performs for every video.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_walker --files 100000 --languages en es
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import core
+
+
+def make_tree(root, files, per_directory=50):
+    """
+    Creates a synthetic library of `files` entries: videos, some subtitles and the usual
+    clutter (nfo, jpg) spread over show/season directories.
+    """
+    kinds = ('.mkv', '.en.srt', '.nfo', '.jpg', '.mp4')
+    for i in range(files):
+        directory = Path(root) / f"Show {i // (per_directory * 10):04d}" / f"Season {(i // per_directory) % 10:02d}"
+        if i % per_directory == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        episode = i // len(kinds)
+        (directory / f"Episode.{episode:06d}{kinds[i % len(kinds)]}").touch()
+
+
+def legacy_walk(folders, languages):
+    """The walker used before the os.scandir rewrite: one rglob per extension, one stat per language."""
+    videos = missing = 0
+    for folder in folders:
+        p = Path(folder)
+        for ext in core.VIDEO_EXTENSIONS:
+            for video_path in p.rglob(f'*{ext}'):
+                videos += 1
+                for lang in languages:
+                    if not video_path.with_name(f"{video_path.stem}.{lang}.srt").exists():
+                        missing += 1
+    return videos, missing
+
+
+def scandir_walk(folders, languages):
+    videos = missing = 0
+    for video in core.scan_videos(folders):
+        videos += 1
+        missing += len(core.find_missing_languages(video, languages))
+    return videos, missing
+
+
+def measure(walker, folders, languages):
+    start = time.perf_counter()
+    videos, missing = walker(folders, languages)
+    return time.perf_counter() - start, videos, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('-l', '--languages', nargs='+', default=['en', 'es'])
+    parser.add_argument('--root', help='Existing library to walk instead of a synthetic tree.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.root
+        if root is None:
+            root = tmp
+            start = time.perf_counter()
+            make_tree(root, args.files)
+            print(f"Generated {args.files} files in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'walker':>8} {'seconds':>9} {'videos':>8} {'missing':>8}")
+        for name, walker in (('rglob', legacy_walk), ('scandir', scandir_walk)):
+            elapsed, videos, missing = measure(walker, [root], args.languages)
+            print(f"{name:>8} {elapsed:>9.2f} {videos:>8} {missing:>8}")
+
+
+if __name__ == '__main__':
+    main()
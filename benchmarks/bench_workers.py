@@ -0,0 +1,54 @@
+# subtitlarr/benchmarks/bench_workers.py
+"""
+Measures run_downloader throughput for different worker counts against the fake provider.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_workers --videos 40 --latency 0.1 --workers 1 2 4 8 --batch-size 5 25
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import core
+from benchmarks import fake_provider
+
+
+def make_library(root, count):
+    """Creates `count` tiny episode files that subliminal can scan."""
+    for i in range(count):
+        season = i // 20 + 1
+        episode = i % 20 + 1
+        (Path(root) / f"Benchmark.Show.S{season:02d}E{episode:02d}.720p.mkv").write_bytes(b'\0' * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.1, help='Fake provider latency per call, in seconds.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[core.DEFAULT_BATCH_SIZE],
+                        help='Batch sizes to compare.')
+    parser.add_argument('-l', '--languages', nargs='+', default=['en'])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    os.environ['SUBTITLARR_FAKE_LATENCY'] = str(args.latency)
+    fake_provider.register()
+
+    print(f"{'workers':>8} {'batch':>6} {'seconds':>9} {'videos/s':>9}")
+    for batch_size in args.batch_size:
+        for workers in args.workers:
+            with tempfile.TemporaryDirectory() as root:
+                make_library(root, args.videos)
+                start = time.perf_counter()
+                core.run_downloader([root], args.languages, max_workers=workers, providers=['fake'],
+                                    batch_size=batch_size)
+                elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {batch_size:>6} {elapsed:>9.2f} {args.videos / elapsed:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# subtitlarr/benchmarks/fake_provider.py
+"""A local subliminal provider that simulates network latency without touching the network."""
+import os
+import random
+import time
+
+from babelfish import Language
+from subliminal import provider_manager
+from subliminal.providers import Provider
+from subliminal.subtitle import Subtitle
+
+FAKE_SRT = b"1\n00:00:01,000 --> 00:00:02,000\nSubtitlarr benchmark subtitle\n"
+
+
+class FakeSubtitle(Subtitle):
+    provider_name = 'fake'
+
+    def __init__(self, language, subtitle_id):
+        super().__init__(language, subtitle_id)
+
+    @property
+    def id(self):
+        return self.subtitle_id
+
+    def get_matches(self, video):
+        return {'title'}
+
+
+class FakeProvider(Provider):
+    """
+    Provider with tunable behaviour, configured through environment variables so that
+    every ProviderPool (one per worker) picks up the same settings:
+
+        SUBTITLARR_FAKE_LATENCY   seconds slept on every query (default 0.05)
+        SUBTITLARR_FAKE_FAILURE   probability of raising on a query (default 0.0)
+        SUBTITLARR_FAKE_HIT_RATE  probability of returning a subtitle (default 1.0)
+    """
+    languages = {Language.fromalpha2(code) for code in ('en', 'es', 'fr', 'de', 'it', 'pt')}
+    subtitle_class = FakeSubtitle
+
+    def __init__(self, latency=None, failure_rate=None, hit_rate=None):
+        self.latency = float(latency if latency is not None else os.environ.get('SUBTITLARR_FAKE_LATENCY', 0.05))
+        self.failure_rate = float(failure_rate if failure_rate is not None else os.environ.get('SUBTITLARR_FAKE_FAILURE', 0.0))
+        self.hit_rate = float(hit_rate if hit_rate is not None else os.environ.get('SUBTITLARR_FAKE_HIT_RATE', 1.0))
+
+    def initialize(self):
+        # Simula el login/handshake de un proveedor real
+        time.sleep(self.latency)
+
+    def terminate(self):
+        pass
+
+    def list_subtitles(self, video, languages):
+        time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError('Simulated provider failure')
+        if random.random() >= self.hit_rate:
+            return []
+        return [FakeSubtitle(language, f'{video.name}:{language}') for language in languages]
+
+    def download_subtitle(self, subtitle):
+        time.sleep(self.latency)
+        subtitle.content = FAKE_SRT
+
+
+def register():
+    """Registers the fake provider with subliminal under the name 'fake'."""
+    entry_point = 'fake = benchmarks.fake_provider:FakeProvider'
+    if 'fake' not in provider_manager.names():
+        provider_manager.register(entry_point)
@@ -0,0 +1,116 @@
+# subtitlarr/benchmarks/fake_webhook.py
+"""
+A local HTTP stand-in for Discord/Slack webhooks, with configurable latency and failures,
+and a benchmark of the time notifications add to the caller.
+
+Usage (from the repository root):
+    python -m benchmarks.fake_webhook --latency 2 --failure-rate 0.3 --messages 5 --videos 200
+"""
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import notifications
+
+
+class FakeWebhookServer:
+    """
+    Records every JSON payload posted to it. Each request waits `latency` seconds and fails
+    with `failure_status` with probability `failure_rate`.
+
+    Usable as a context manager; `url` is only valid while the server is running.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, failure_status=503):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.received = []
+        self.requests = 0
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/webhook"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                time.sleep(server.latency)
+                with server._lock:
+                    server.requests += 1
+                    server.connections.add(self.client_address)
+                    failed = random.random() < server.failure_rate
+                    if not failed:
+                        server.received.append(json.loads(body or b'{}'))
+                self.send_response(server.failure_status if failed else 204)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=2.0, help='Webhook response time, in seconds.')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of requests answered with HTTP 503.')
+    parser.add_argument('--messages', type=int, default=5, help='Start/finish style notifications to send.')
+    parser.add_argument('--videos', type=int, default=200, help='Per-video results folded into one digest.')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    with FakeWebhookServer(args.latency, args.failure_rate) as server:
+        start = time.perf_counter()
+        for i in range(args.messages):
+            notifications.send_notification(server.url, f"Message {i}")
+        blocking = time.perf_counter() - start
+
+        dispatcher = notifications.NotificationDispatcher(retry_backoff_seconds=0.1)
+        start = time.perf_counter()
+        for i in range(args.messages):
+            dispatcher.notify(server.url, f"Message {i}")
+        for i in range(args.videos):
+            dispatcher.record_video(server.url, f"Video {i}.mkv", saved_count=1)
+        queued = time.perf_counter() - start
+        dispatcher.close(timeout=60)
+        delivered = time.perf_counter() - start
+
+        print(f"send_notification: {blocking:.2f}s spent by the caller for {args.messages} message(s)")
+        print(f"dispatcher:        {queued * 1000:.1f}ms spent by the caller, "
+              f"{delivered:.2f}s until {server.requests} request(s) were delivered")
+        print(f"metrics:           {json.dumps(dispatcher.metrics())}")
+
+
+if __name__ == '__main__':
+    main()
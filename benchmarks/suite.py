@@ -0,0 +1,344 @@
+# subtitlarr/benchmarks/suite.py
+"""
+Reproducible benchmark suite over a synthetic library and the fake subtitle provider.
+
+Benchmarks:
+    scan.walk         scan_media_status walking the disk
+    scan.index_cold   scan_media_status with a new, empty LibraryIndex
+    scan.index_warm   scan_media_status with an up-to-date LibraryIndex
+    download          run_downloader against the fake provider
+    stream.scan       POST /scan through app.py: time to the first NDJSON line and to the summary
+    sse               delivery latency of log events from app.status_callback to /stream clients
+
+Timings are the median of --repeat runs; peak memory (tracemalloc) comes from one extra
+run, since tracing slows Python down. Results are printed as JSON and written to --output;
+--compare prints the change of every metric against an earlier result file.
+
+Usage (from the repository root):
+    python -m benchmarks.suite --videos 5000 --depth 3 --download-videos 200 --latency 0.02 --output bench.json
+    python -m benchmarks.suite --videos 5000 --depth 3 --download-videos 200 --latency 0.02 --compare bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import core
+from benchmarks import fake_provider
+from library_index import LibraryIndex
+
+FORMAT_VERSION = 1
+# Directories per level below the first one (seasons per show, discs per season...)
+FANOUT = 10
+
+
+def make_media_tree(root, videos, depth=2, per_directory=20, subtitle_ratio=0.5, languages=('en',), clutter=True):
+    """
+    Creates a deterministic synthetic library under `root`.
+
+    Videos are grouped `per_directory` to a folder, nested `depth` levels deep
+    (Show NNNN / Season NN / Disc NN / ...). The first language has a subtitle for
+    `subtitle_ratio` of the videos, and with `clutter` every video gets an .nfo next to it.
+
+    Returns:
+        int: Number of videos created.
+    """
+    depth = max(1, depth)
+    names = ['Show {:04d}', 'Season {:02d}'] + ['Disc {:02d}'] * (depth - 2)
+    with_subtitle = int(subtitle_ratio * 100)
+    for i in range(videos):
+        directory_number = i // per_directory
+        levels = [directory_number // FANOUT ** (depth - 1)]
+        levels += [directory_number // FANOUT ** (depth - 1 - level) % FANOUT for level in range(1, depth)]
+        directory = Path(root).joinpath(*(names[level].format(value) for level, value in enumerate(levels)))
+        if i % per_directory == 0:
+            directory.mkdir(parents=True, exist_ok=True)
+        season = levels[1] + 1 if depth > 1 else 1
+        stem = f"Show.{levels[0]:04d}.S{season:02d}E{i % 1000:03d}"
+        (directory / f"{stem}.mkv").write_bytes(b'\0' * 1024)
+        if i % 100 < with_subtitle:
+            (directory / f"{stem}.{languages[0]}.srt").write_bytes(fake_provider.FAKE_SRT)
+        if clutter:
+            (directory / f"{stem}.nfo").touch()
+    # Like an established library: directories changed seconds ago would be re-listed by every refresh
+    settled = time.time() - 3600
+    for directory, _, _ in os.walk(root):
+        os.utime(directory, (settled, settled))
+    return videos
+
+
+def measure(func, repeat=3, setup=None):
+    """
+    Times `func(setup())` `repeat` times, then once more under tracemalloc.
+
+    Returns:
+        tuple: The result of the last timed run and a dict with the median and fastest
+        time in seconds and the peak traced memory in MiB.
+    """
+    timings = []
+    result = None
+    for _ in range(max(1, repeat)):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        result = func(argument)
+        timings.append(time.perf_counter() - start)
+
+    argument = setup() if setup else None
+    tracemalloc.start()
+    try:
+        func(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, {
+        'seconds': round(statistics.median(timings), 4),
+        'seconds_min': round(min(timings), 4),
+        'peak_memory_mib': round(peak / 2 ** 20, 2),
+    }
+
+
+def bench_scan(tree, languages, workdir, repeat):
+    results = {}
+    scan = lambda index: core.scan_media_status([tree], languages, index=index)
+
+    indexes = []
+
+    def new_index():
+        index = LibraryIndex(os.path.join(workdir, f"scan-{len(indexes)}.db"), core.VIDEO_EXTENSIONS)
+        indexes.append(index)
+        return index
+
+    warm_index = new_index()
+    scan(warm_index)
+    for name, setup in (('walk', None), ('index_cold', new_index), ('index_warm', lambda: warm_index)):
+        status, stats = measure(scan, repeat, setup)
+        videos = status[0]['videos']
+        stats.update({'videos': videos, 'videos_per_second': round(videos / stats['seconds'], 1)})
+        results[f'scan.{name}'] = stats
+    for index in indexes:
+        index.close()
+    return results
+
+
+def bench_download(args, workdir):
+    runs = []
+
+    def setup():
+        # Every run starts from a fresh library, since the previous one saved all the subtitles
+        run_dir = os.path.join(workdir, f"download-{len(runs)}")
+        tree = os.path.join(run_dir, 'media')
+        make_media_tree(tree, args.download_videos, args.depth, args.per_directory, subtitle_ratio=0,
+                        languages=args.languages, clutter=False)
+        index = LibraryIndex(os.path.join(run_dir, 'library.db'), core.VIDEO_EXTENSIONS)
+        runs.append(index)
+        return tree, index
+
+    def download(prepared):
+        tree, index = prepared
+        return core.run_downloader([tree], args.languages, providers=['fake'], index=index,
+                                   max_workers=args.workers, batch_size=args.batch_size)
+
+    summary, stats = measure(download, args.download_repeat, setup)
+    for index in runs:
+        index.close()
+    stats.update({
+        'videos': summary['videos']['searched'],
+        'videos_per_second': round(summary['videos']['searched'] / stats['seconds'], 1),
+        'saved': summary['saved_count'],
+        'errors': summary['videos']['errors'],
+        'stages': {name: stage['seconds'] for name, stage in summary['stages'].items() if stage['count']},
+    })
+    return {'download': stats}
+
+
+def load_app(tree, languages, workdir):
+    """Imports app.py with a config of its own, so that the benchmark never touches the real one."""
+    config = {
+        'search_paths': [tree], 'languages': list(languages), 'schedule_enabled': False,
+        'min_file_size_mb': 0, 'cache_path': os.path.join(workdir, 'cache'),
+    }
+    with open(os.path.join(workdir, 'config.json'), 'w') as f:
+        json.dump(config, f)
+    os.chdir(workdir)
+    import app
+    return app
+
+
+def bench_stream_scan(app, repeat):
+    client = app.app.test_client()
+    first_record, totals, records = [], [], 0
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        response = client.post('/scan', buffered=False)
+        first = None
+        records = 0
+        for chunk in response.response:
+            if first is None:
+                first = time.perf_counter() - start
+            records += chunk.count(b"\n") if isinstance(chunk, bytes) else chunk.count("\n")
+        totals.append(time.perf_counter() - start)
+        first_record.append(first)
+        response.close()
+    return {'stream.scan': {
+        'first_record_seconds': round(statistics.median(first_record), 4),
+        'seconds': round(statistics.median(totals), 4),
+        'records': records,
+    }}
+
+
+def bench_sse(app, events, clients, interval):
+    """Publishes `events` log events through app.status_callback and times their arrival at every client."""
+    prefix = f"bench-{os.getpid()}"
+    latencies = []
+    lock = threading.Lock()
+    ready = threading.Barrier(clients + 1)
+
+    def read():
+        response = app.app.test_client().get('/stream', buffered=False)
+        ready.wait()
+        try:
+            for chunk in response.response:
+                received = time.perf_counter()
+                text = chunk.decode() if isinstance(chunk, bytes) else chunk
+                for line in text.splitlines():
+                    if not line.startswith('data: '):
+                        continue
+                    message = json.loads(line[6:])['message']
+                    if not message.startswith(prefix):
+                        continue
+                    if message.endswith('done'):
+                        return
+                    with lock:
+                        latencies.append(received - float(message.split()[1]))
+        finally:
+            response.close()
+
+    readers = [threading.Thread(target=read, daemon=True) for _ in range(clients)]
+    for reader in readers:
+        reader.start()
+    ready.wait()
+    # The generators subscribe when they are first iterated
+    deadline = time.monotonic() + 5
+    while app.event_broadcaster.subscriber_count() < clients and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    for _ in range(events):
+        app.status_callback(f"{prefix} {time.perf_counter()}", event_type="log")
+        if interval:
+            time.sleep(interval)
+    app.status_callback(f"{prefix} done", event_type="log")
+    for reader in readers:
+        reader.join(timeout=30)
+
+    latencies.sort()
+    result = {'events': events, 'clients': clients, 'delivered': len(latencies)}
+    if latencies:
+        result.update({
+            'latency_ms_p50': round(latencies[len(latencies) // 2] * 1000, 3),
+            'latency_ms_p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 3),
+            'latency_ms_max': round(latencies[-1] * 1000, 3),
+        })
+    return {'sse': result}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'git_commit': commit}
+
+
+def compare(current, baseline):
+    """Prints every numeric metric present in both result sets with its relative change."""
+    if baseline.get('params') != current.get('params'):
+        print("Warning: the baseline was run with different parameters.", file=sys.stderr)
+    print(f"{'metric':<40} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, metrics in current['results'].items():
+        old_metrics = baseline.get('results', {}).get(name, {})
+        for metric, value in metrics.items():
+            old = old_metrics.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old:+.1%}" if old else "n/a"
+            print(f"{name + '.' + metric:<40} {old:>12} {value:>12} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--videos', type=int, default=2000, help='Videos in the scanned library.')
+    parser.add_argument('--depth', type=int, default=2, help='Directory levels (Show/Season/Disc...).')
+    parser.add_argument('--per-directory', type=int, default=20, help='Videos per directory.')
+    parser.add_argument('-l', '--languages', nargs='+', default=['en', 'es'])
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per scan benchmark.')
+    parser.add_argument('--download-videos', type=int, default=100, help='Videos in the downloaded library.')
+    parser.add_argument('--download-repeat', type=int, default=1, help='Timed runs of the download benchmark.')
+    parser.add_argument('--latency', type=float, default=0.02, help='Fake provider latency per call, in seconds.')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of fake provider queries that fail.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=core.DEFAULT_BATCH_SIZE)
+    parser.add_argument('--sse-events', type=int, default=200)
+    parser.add_argument('--sse-clients', type=int, default=3)
+    parser.add_argument('--sse-interval', type=float, default=0.005, help='Seconds between two published events.')
+    parser.add_argument('--skip', nargs='*', default=[], choices=['scan', 'download', 'stream', 'sse'])
+    parser.add_argument('--output', help='Write the JSON results to this file.')
+    parser.add_argument('--compare', help='Earlier JSON results to compare against.')
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    os.environ['SUBTITLARR_FAKE_LATENCY'] = str(args.latency)
+    os.environ['SUBTITLARR_FAKE_FAILURE'] = str(args.failure_rate)
+    fake_provider.register()
+
+    params = {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'skip')}
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='subtitlarr-bench-') as workdir:
+        core.configure_cache(os.path.join(workdir, 'subliminal'), 'memory')
+        tree = os.path.join(workdir, 'media')
+        make_media_tree(tree, args.videos, args.depth, args.per_directory, languages=args.languages)
+
+        if 'scan' not in args.skip:
+            results.update(bench_scan(tree, args.languages, workdir, args.repeat))
+        if 'download' not in args.skip:
+            results.update(bench_download(args, workdir))
+        if 'stream' not in args.skip or 'sse' not in args.skip:
+            try:
+                app = load_app(tree, args.languages, workdir)
+                if 'stream' not in args.skip:
+                    results.update(bench_stream_scan(app, args.repeat))
+                if 'sse' not in args.skip:
+                    results.update(bench_sse(app, args.sse_events, args.sse_clients, args.sse_interval))
+            finally:
+                os.chdir(cwd)
+
+    report = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'environment': environment(),
+        'params': params,
+        'results': results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+# subtitlarr/cache_backend.py
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from dogpile.cache import register_backend
+from dogpile.cache.api import NO_VALUE, BytesBackend
+
+DEFAULT_MAX_ENTRIES = 50000
+DEFAULT_TTL_HOURS = 24 * 30
+DEFAULT_MEMORY_ENTRIES = 2000
+
+# Accessed timestamps are only rewritten when older than this, to keep reads mostly read-only.
+ACCESS_RESOLUTION_SECONDS = 60
+# How many writes happen between two size checks.
+EVICTION_CHECK_INTERVAL = 500
+# Memory hits whose `accessed` time is written to SQLite in one batch.
+TOUCH_BATCH_SIZE = 100
+
+
+class SQLiteBackend(BytesBackend):
+    """
+    dogpile.cache backend storing the subliminal cache in a single SQLite file in WAL mode,
+    so concurrent download workers can read while another one writes.
+
+    Entries older than `ttl_hours` are treated as missing and purged on compaction; when the
+    table grows past `max_entries` the least recently used entries are evicted.
+
+    Arguments (passed through region.configure):
+        filename (str): Path of the database file.
+        max_entries (int, optional): Maximum number of entries kept.
+        ttl_hours (float, optional): Lifetime of an entry; 0 disables expiration.
+    """
+
+    def __init__(self, arguments):
+        self.filename = arguments['filename']
+        self.max_entries = int(arguments.get('max_entries', DEFAULT_MAX_ENTRIES))
+        self.ttl = float(arguments.get('ttl_hours', DEFAULT_TTL_HOURS)) * 3600
+        self.stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expired': 0}
+        self._lock = threading.RLock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(self.filename)), exist_ok=True)
+        self._conn = sqlite3.connect(self.filename, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def _expired(self, created, now):
+        return self.ttl > 0 and now - created > self.ttl
+
+    # --- BytesBackend API ---
+
+    def _read(self, key):
+        """Returns the (value, created) of a live entry, or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            value, created, accessed = row
+            if self._expired(created, now):
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.stats['misses'] += 1
+                self.stats['expired'] += 1
+                return None
+            if now - accessed > ACCESS_RESOLUTION_SECONDS:
+                with self._conn:
+                    self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.stats['hits'] += 1
+            return value, created
+
+    def get_serialized(self, key):
+        entry = self._read(key)
+        return NO_VALUE if entry is None else entry[0]
+
+    def get_serialized_multi(self, keys):
+        return [self.get_serialized(key) for key in keys]
+
+    def set_serialized(self, key, value):
+        self.set_serialized_multi({key: value})
+
+    def set_serialized_multi(self, mapping):
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    [(key, value, now, now) for key, value in mapping.items()],
+                )
+            self.stats['sets'] += len(mapping)
+            self._writes += len(mapping)
+            if self._writes >= EVICTION_CHECK_INTERVAL:
+                self._writes = 0
+                self.evict()
+
+    def delete(self, key):
+        self.delete_multi([key])
+
+    def delete_multi(self, keys):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+
+    # --- Maintenance ---
+
+    def evict(self):
+        """Removes expired entries and the least recently used ones beyond `max_entries`."""
+        now = time.time()
+        with self._lock, self._conn:
+            expired = []
+            if self.ttl > 0:
+                expired = [key for key, in self._conn.execute(
+                    "SELECT key FROM cache WHERE created < ?", (now - self.ttl,))]
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in expired])
+            count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            evicted = []
+            if self.max_entries > 0 and count > self.max_entries:
+                evicted = [key for key, in self._conn.execute(
+                    "SELECT key FROM cache ORDER BY accessed LIMIT ?", (count - self.max_entries,))]
+                self._conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in evicted])
+            removed = expired + evicted
+            self._dropped(removed)
+            self.stats['expired'] += len(expired)
+            self.stats['evictions'] += len(evicted)
+        return len(removed)
+
+    def _dropped(self, keys):
+        """Called with the keys removed by evict(), for the subclasses that keep copies."""
+
+    def compact(self):
+        """
+        Evicts stale entries, then rewrites the database file and truncates the WAL.
+
+        Returns:
+            dict: Entries removed and file size before and after, in bytes.
+        """
+        before = self.size_on_disk()
+        removed = self.evict()
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+        after = self.size_on_disk()
+        logging.info(f"Cache compacted: {removed} entries removed, {before} -> {after} bytes.")
+        return {'removed': removed, 'bytes_before': before, 'bytes_after': after}
+
+    def size_on_disk(self):
+        return sum(
+            os.path.getsize(path)
+            for path in (self.filename, self.filename + '-wal', self.filename + '-shm')
+            if os.path.exists(path)
+        )
+
+    def info(self):
+        """Returns the hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            stats = dict(self.stats)
+        lookups = stats['hits'] + stats['misses']
+        stats.update({
+            'backend': 'sqlite',
+            'entries': entries,
+            'max_entries': self.max_entries,
+            'ttl_hours': self.ttl / 3600,
+            'hit_rate': stats['hits'] / lookups if lookups else None,
+            'bytes_on_disk': self.size_on_disk(),
+        })
+        return stats
+
+
+class MemorySQLiteBackend(SQLiteBackend):
+    """
+    SQLiteBackend with an in-memory LRU of the `memory_entries` most recently used values
+    in front of it, so hot keys (provider searches repeated within a run) skip the disk.
+
+    Arguments: those of SQLiteBackend, plus `memory_entries` (int, optional).
+    """
+
+    def __init__(self, arguments):
+        super().__init__(arguments)
+        self.memory_entries = int(arguments.get('memory_entries', DEFAULT_MEMORY_ENTRIES))
+        self._memory = OrderedDict()
+        self._touched = set()
+        self._last_touch = time.time()
+        self.stats['memory_hits'] = 0
+
+    def get_serialized(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if not self._expired(created, time.time()):
+                    self._memory.move_to_end(key)
+                    self.stats['hits'] += 1
+                    self.stats['memory_hits'] += 1
+                    self._touch(key)
+                    return value
+                del self._memory[key]
+        entry = self._read(key)
+        if entry is None:
+            return NO_VALUE
+        self._remember(key, *entry)
+        return entry[0]
+
+    def set_serialized_multi(self, mapping):
+        now = time.time()
+        super().set_serialized_multi(mapping)
+        for key, value in mapping.items():
+            self._remember(key, value, now)
+
+    def _touch(self, key):
+        """
+        Marks a memory hit so that its `accessed` time on disk follows, otherwise the SQLite LRU
+        would evict the hottest keys. Written in batches, at most every ACCESS_RESOLUTION_SECONDS.
+        """
+        self._touched.add(key)
+        if len(self._touched) >= TOUCH_BATCH_SIZE or time.time() - self._last_touch > ACCESS_RESOLUTION_SECONDS:
+            self._flush_touched()
+
+    def _flush_touched(self):
+        with self._lock:
+            self._last_touch = now = time.time()
+            if not self._touched:
+                return
+            with self._conn:
+                self._conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?",
+                                       [(now, key) for key in self._touched])
+            self._touched.clear()
+
+    def delete_multi(self, keys):
+        with self._lock:
+            for key in keys:
+                self._memory.pop(key, None)
+        super().delete_multi(keys)
+
+    def evict(self):
+        # The LRU order on disk must include the memory hits before choosing what to evict
+        self._flush_touched()
+        return super().evict()
+
+    def _dropped(self, keys):
+        with self._lock:
+            for key in keys:
+                self._memory.pop(key, None)
+                self._touched.discard(key)
+
+    def _remember(self, key, value, created):
+        # `created` is the one stored on disk, so a value read back from SQLite keeps its original TTL
+        with self._lock:
+            self._memory[key] = (value, created)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def info(self):
+        stats = super().info()
+        with self._lock:
+            stats.update({'backend': 'memory+sqlite', 'memory_entries': len(self._memory),
+                          'memory_max_entries': self.memory_entries})
+        return stats
+
+
+register_backend('subtitlarr.sqlite', 'cache_backend', 'SQLiteBackend')
+register_backend('subtitlarr.memory_sqlite', 'cache_backend', 'MemorySQLiteBackend')
@@ -0,0 +1,356 @@
+# subtitlarr/config_store.py
+import copy
+import json
+import logging
+import os
+import threading
+
+import cache_backend
+import core
+import notifications
+import providers
+import work_queue
+
+DEFAULT_CONFIG_PATH = "config.json"
+
+DEFAULT_CONFIG = {
+    "search_paths": [], "languages": [], "schedule_enabled": False,
+    "schedule_interval_minutes": 60,
+    "incremental_schedule": True,
+    "full_scan_interval_hours": 24,
+    "min_file_size_mb": 50,
+    "exclude_patterns": list(core.DEFAULT_EXCLUDE_PATTERNS),
+    "max_concurrent_workers": 2,
+    "batch_size": core.DEFAULT_BATCH_SIZE,
+    "download_priority": work_queue.DEFAULT_PRIORITY,
+    "arrival_check_minutes": core.DEFAULT_ARRIVAL_CHECK_MINUTES,
+    "probe_embedded_subtitles": False,
+    "cache_path": core.DEFAULT_CACHE_PATH,
+    "cache_backend": "memory",
+    "cache_max_entries": cache_backend.DEFAULT_MAX_ENTRIES,
+    "cache_ttl_hours": cache_backend.DEFAULT_TTL_HOURS,
+    "provider_rate_limits": dict(providers.DEFAULT_RATE_LIMITS),
+    "provider_failure_threshold": providers.DEFAULT_FAILURE_THRESHOLD,
+    "provider_cooldown_minutes": providers.DEFAULT_COOLDOWN_MINUTES,
+    "credentials": {
+        "opensubtitles": {"username": "", "password": ""},
+        "opensubtitlescom": {"username": "", "password": "", "api_key": ""},
+        "addic7ed": {"username": "", "password": ""}
+    },
+    "notifications": {
+        "enabled": False, "webhook_url": "", "notify_on_start": True,
+        "notify_on_completion": True, "notify_on_errors": True,
+        "include_errors": True, "webhook_type": "auto",
+        "send_digest": False,
+        "digest_interval_minutes": notifications.DEFAULT_DIGEST_INTERVAL_MINUTES
+    }
+}
+
+# Environment variables that override the credentials of the config file.
+ENVIRONMENT_OVERRIDES = {
+    "OPENSUBTITLES_USERNAME": ("credentials", "opensubtitles", "username"),
+    "OPENSUBTITLES_PASSWORD": ("credentials", "opensubtitles", "password"),
+    "OPENSUBTITLESCOM_USERNAME": ("credentials", "opensubtitlescom", "username"),
+    "OPENSUBTITLESCOM_PASSWORD": ("credentials", "opensubtitlescom", "password"),
+    "OPENSUBTITLESCOM_APIKEY": ("credentials", "opensubtitlescom", "api_key"),
+    "ADDIC7ED_USERNAME": ("credentials", "addic7ed", "username"),
+    "ADDIC7ED_PASSWORD": ("credentials", "addic7ed", "password"),
+}
+
+
+class Field:
+    """
+    Expected type of a config value.
+
+    Args:
+        kind (type): bool, int, float (also accepts integers), str, list or dict.
+        items (type, optional): Type of the elements of a list or of the values of a dict.
+        minimum (float, optional): Smallest accepted number.
+        choices (iterable, optional): Accepted values.
+    """
+
+    def __init__(self, kind, items=None, minimum=None, choices=None):
+        self.kind = kind
+        self.items = items
+        self.minimum = minimum
+        self.choices = choices
+
+    def check(self, value):
+        """Returns a description of what is wrong with `value`, or None if it is valid."""
+        if not _is_a(value, self.kind):
+            return f"must be of type {self.kind.__name__}"
+        if self.items is not None:
+            elements = value.values() if self.kind is dict else value
+            if not all(_is_a(element, self.items) for element in elements):
+                return f"must only contain values of type {self.items.__name__}"
+        if self.minimum is not None and value < self.minimum:
+            return f"must be at least {self.minimum}"
+        if self.choices is not None and value not in self.choices:
+            return f"must be one of: {', '.join(sorted(self.choices))}"
+        return None
+
+
+def _is_a(value, kind):
+    # bool is a subclass of int, but True is not a valid number of workers
+    if isinstance(value, bool):
+        return kind is bool
+    if kind is float:
+        return isinstance(value, (int, float))
+    if kind is list:
+        return isinstance(value, (list, tuple))
+    return isinstance(value, kind)
+
+
+CONFIG_SCHEMA = {
+    "search_paths": Field(list, items=str),
+    "languages": Field(list, items=str),
+    "schedule_enabled": Field(bool),
+    "schedule_interval_minutes": Field(int, minimum=1),
+    "incremental_schedule": Field(bool),
+    "full_scan_interval_hours": Field(float, minimum=0),
+    "min_file_size_mb": Field(float, minimum=0),
+    "exclude_patterns": Field(list, items=str),
+    "max_concurrent_workers": Field(int, minimum=1),
+    "batch_size": Field(int, minimum=1),
+    "download_priority": Field(str, choices=work_queue.PRIORITIES),
+    "arrival_check_minutes": Field(float, minimum=0),
+    "probe_embedded_subtitles": Field(bool),
+    "cache_path": Field(str),
+    "cache_backend": Field(str, choices=core.CACHE_BACKENDS),
+    "cache_max_entries": Field(int, minimum=0),
+    "cache_ttl_hours": Field(float, minimum=0),
+    "provider_rate_limits": Field(dict, items=float),
+    "provider_failure_threshold": Field(int, minimum=1),
+    "provider_cooldown_minutes": Field(float, minimum=0),
+    "credentials": {
+        provider: {key: Field(str) for key in keys}
+        for provider, keys in DEFAULT_CONFIG["credentials"].items()
+    },
+    "notifications": {
+        "enabled": Field(bool),
+        "webhook_url": Field(str),
+        "notify_on_start": Field(bool),
+        "notify_on_completion": Field(bool),
+        "notify_on_errors": Field(bool),
+        "include_errors": Field(bool),
+        "webhook_type": Field(str),
+        "send_digest": Field(bool),
+        "digest_interval_minutes": Field(float, minimum=1),
+    },
+}
+
+
+class ConfigError(ValueError):
+    """Raised when a config does not match the schema; `errors` lists every problem found."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{'.'.join(path)} {message}" for path, message in errors))
+
+
+def validate(config, schema=CONFIG_SCHEMA, path=()):
+    """
+    Checks a config against a schema. Keys that are not in the schema are not checked.
+
+    Returns:
+        list: (key path, message) for every invalid value.
+    """
+    errors = []
+    for key, field in schema.items():
+        if key not in config:
+            continue
+        value = config[key]
+        if isinstance(field, dict):
+            if not isinstance(value, dict):
+                errors.append((path + (key,), "must be an object"))
+            else:
+                errors.extend(validate(value, field, path + (key,)))
+            continue
+        message = field.check(value)
+        if message:
+            errors.append((path + (key,), message))
+    return errors
+
+
+class FrozenDict(dict):
+    """A dict that cannot be modified, used for config snapshots."""
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("Config snapshots are read-only; use thaw() to get an editable copy.")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def freeze(value):
+    """Returns a read-only deep copy: dicts become FrozenDict and lists become tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Returns an editable deep copy of a frozen config."""
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def merge_defaults(config, defaults=DEFAULT_CONFIG):
+    """Fills in the missing keys (and missing keys of nested sections) from the defaults."""
+    for key, value in defaults.items():
+        if key not in config:
+            config[key] = copy.deepcopy(value)
+        elif isinstance(value, dict) and isinstance(config[key], dict):
+            for sub_key in value:
+                if sub_key not in config[key]:
+                    config[key][sub_key] = copy.deepcopy(value[sub_key])
+    return config
+
+
+def apply_environment(config, overrides=ENVIRONMENT_OVERRIDES):
+    """Replaces the config values that are set through environment variables."""
+    for variable, path in overrides.items():
+        if variable not in os.environ:
+            continue
+        section = config
+        for key in path[:-1]:
+            section = section.setdefault(key, {})
+        section[path[-1]] = os.environ[variable]
+    return config
+
+
+class ConfigStore:
+    """
+    Keeps the parsed config in memory.
+
+    The file is only read again when its modification time (or size) changes, and
+    `get()` returns the same immutable snapshot until then, so a job can keep the
+    snapshot it started with even if the config is saved while it runs.
+
+    Invalid values found in the file are replaced by their defaults (with a warning);
+    `save()` rejects them with a ConfigError instead.
+
+    Args:
+        path (str, optional): Path of the JSON config file.
+    """
+
+    def __init__(self, path=DEFAULT_CONFIG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stored = None
+        self._signature = None
+        self._listeners = []
+
+    def add_listener(self, callback):
+        """Calls `callback(snapshot)` every time the config changes after the first load."""
+        self._listeners.append(callback)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _read_file(self):
+        try:
+            with open(self.path, "r") as f:
+                config = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not read {self.path}: {e}")
+            return None
+        if not isinstance(config, dict):
+            logging.warning(f"Ignoring {self.path}: the config must be a JSON object.")
+            return None
+        return config
+
+    def _build(self, config):
+        config = merge_defaults(config)
+        for path, message in validate(config):
+            logging.warning(f"Invalid config value {'.'.join(path)} ({message}); using the default.")
+            section, default = config, DEFAULT_CONFIG
+            for key in path[:-1]:
+                section, default = section[key], default[key]
+            section[path[-1]] = copy.deepcopy(default[path[-1]])
+        # Without the environment overrides, so that saving does not write them to the file
+        self._stored = freeze(config)
+        return freeze(apply_environment(config))
+
+    def get(self):
+        """Returns the current config snapshot, reloading the file if it changed on disk."""
+        changed = None
+        with self._lock:
+            signature = self._file_signature()
+            if self._snapshot is None or signature != self._signature:
+                config = self._read_file()
+                # A file that cannot be parsed (e.g. half written by an editor) keeps the last good snapshot
+                if config is not None or self._snapshot is None:
+                    first_load = self._snapshot is None
+                    self._snapshot = self._build(config or {})
+                    if not first_load:
+                        logging.info(f"{self.path} changed on disk; config reloaded.")
+                        changed = self._snapshot
+                self._signature = signature
+            snapshot = self._snapshot
+        if changed is not None:
+            self._notify(changed)
+        return snapshot
+
+    def reload(self):
+        """Forces the next `get()` to read the file again."""
+        with self._lock:
+            self._signature = None
+        return self.get()
+
+    def save(self, new_config):
+        """
+        Validates and writes a new config. Top-level keys missing from `new_config` keep their current value.
+
+        Returns:
+            FrozenDict: The new snapshot.
+
+        Raises:
+            ConfigError: If `new_config` does not match the schema; nothing is written.
+        """
+        if not isinstance(new_config, dict):
+            raise ConfigError([((), "the config must be a JSON object")])
+        errors = validate(new_config)
+        if errors:
+            raise ConfigError(errors)
+
+        self.get()
+        with self._lock:
+            config = thaw(self._stored)
+            config.update(thaw(new_config))
+            config = merge_defaults(config)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(config, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._stored = freeze(config)
+            self._snapshot = freeze(apply_environment(config))
+            self._signature = self._file_signature()
+            snapshot = self._snapshot
+        self._notify(snapshot)
+        return snapshot
+
+    def _notify(self, snapshot):
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                logging.exception("Config listener failed")
@@ -1,164 +1,1020 @@
 # -*- coding: utf-8 -*-
 
+import itertools
+import multiprocessing
 import os
+import queue as queue_module
+import re
 import logging
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from babelfish import Language
 import subliminal
 from subliminal import region
+from library_index import LibraryIndex, normalize_root, walk_videos
+from metrics import RunMetrics, format_summary
+from jobs import JobControl, ProgressFile
+from providers import DEFAULT_RATE_LIMITS, ProviderManager, ProvidersUnavailable, SharedRateLimiter, TrackedProviderPool
+from work_queue import DEFAULT_PRIORITY, PRIORITIES, WorkQueue, arrival_time
+from subtitle_inventory import EMBEDDED_EXTENSIONS, present_languages, probe_embedded_languages
+import cache_backend
 
 # --- Configuración del Cache de Subliminal ---
-# Esto asegura que el cache se guarde en una ruta predecible dentro del contenedor.
-#cache_path = '/app/cache' 
-cache_path = './cache'
-os.makedirs(cache_path, exist_ok=True)
-region.configure(
-    'dogpile.cache.dbm',
-    arguments={'filename': os.path.join(cache_path, 'cache.dbm')}
-)
+# Ruta relativa al directorio de trabajo (/app/cache dentro del contenedor). Aquí viven también
+# el índice de la biblioteca y las estadísticas de los proveedores.
+DEFAULT_CACHE_PATH = './cache'
+# Backends seleccionables para la región de subliminal (ver cache_backend.py)
+CACHE_BACKENDS = {
+    'memory': 'subtitlarr.memory_sqlite',
+    'sqlite': 'subtitlarr.sqlite',
+    'dbm': 'dogpile.cache.dbm',
+}
+cache_path = DEFAULT_CACHE_PATH
+# Argumentos de la última llamada a configure_cache, para configurar igual otros procesos
+cache_settings = (DEFAULT_CACHE_PATH, 'memory', cache_backend.DEFAULT_MAX_ENTRIES, cache_backend.DEFAULT_TTL_HOURS)
 
 # --- Configuración General ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.m4v', '.ts')
+DEFAULT_PROVIDERS = ['opensubtitles', 'opensubtitlescom', 'addic7ed', 'podnapisi', 'tvsubtitles']
+# Vídeos que cada hilo procesa seguidos con el mismo pool de proveedores
+DEFAULT_BATCH_SIZE = 25
+# Cada cuánto se buscan vídeos nuevos durante una descarga para adelantarlos en la cola (0 = nunca)
+DEFAULT_ARRIVAL_CHECK_MINUTES = 5
+# Los vídeos que llegaron hace más de esto son atrasos, no novedades: no cuentan en el tiempo hasta subtítulo
+NEW_MEDIA_MAX_AGE = 7 * 24 * 3600
+# Por debajo de este tamaño el refiner de subliminal no calcula hashes
+HASH_MIN_SIZE = 10 * 1024 * 1024
+# Muestras, trailers y extras que no merece la pena hashear ni buscar en los proveedores
+# (sufijos de archivo y carpetas de extras de Plex/Radarr, ver compile_exclude_patterns)
+DEFAULT_EXCLUDE_PATTERNS = ['sample', 'samples', 'trailer', 'trailers', 'featurette', 'featurettes', 'extras',
+                            'behindthescenes', 'behind the scenes', 'deleted', 'deleted scenes',
+                            'interview', 'interviews']
+# Episodios: "Serie.S01E02", "Serie - 1x02"; la serie es lo que va delante
+EPISODE_PATTERN = re.compile(r'(?:^|[\s._-])(?:s(?P<season>\d{1,4})[\s._-]?e\d{1,4}|(?P<season_x>\d{1,2})x\d{2,3})(?!\d)',
+                             re.IGNORECASE)
+SEASON_FOLDER_PATTERN = re.compile(r'^(?:season|temporada|saison|staffel|s)[\s._-]*\d+$', re.IGNORECASE)
+
+# --- Funciones de Cache ---
+
+def configure_cache(path=DEFAULT_CACHE_PATH, backend='memory', max_entries=cache_backend.DEFAULT_MAX_ENTRIES,
+                    ttl_hours=cache_backend.DEFAULT_TTL_HOURS):
+    """
+    Configura la región de cache de subliminal y el directorio de cache de la aplicación.
+    `backend` es una de las claves de CACHE_BACKENDS; 'dbm' es el backend antiguo, sin límites.
+    """
+    global cache_path, cache_settings
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f"Unknown cache backend '{backend}'. Valid options: {', '.join(CACHE_BACKENDS)}.")
+
+    cache_path = path
+    cache_settings = (path, backend, max_entries, ttl_hours)
+    os.makedirs(cache_path, exist_ok=True)
+    if backend == 'dbm':
+        arguments = {'filename': os.path.join(cache_path, 'cache.dbm')}
+    else:
+        arguments = {
+            'filename': os.path.join(cache_path, 'subliminal.db'),
+            'max_entries': max_entries,
+            'ttl_hours': ttl_hours,
+        }
+    region.configure(CACHE_BACKENDS[backend], arguments=arguments, replace_existing_backend=True)
+    logging.info(f"Subliminal cache: {backend} backend in {cache_path}.")
+
+def cache_info():
+    """ Devuelve los contadores y el tamaño del cache de subliminal. """
+    if not region.is_configured:
+        return {'backend': None}
+    backend = region.backend
+    if hasattr(backend, 'info'):
+        return backend.info()
+    return {'backend': type(backend).__name__}
+
+def compact_cache():
+    """ Elimina las entradas caducadas o sobrantes y compacta el archivo del cache. """
+    backend = region.backend if region.is_configured else None
+    if not hasattr(backend, 'compact'):
+        raise ValueError("The configured cache backend does not support compaction.")
+    return backend.compact()
 
 # --- Funciones de Lógica ---
 
 def scan_videos(folders):
-    """ Escanea recursivamente las carpetas en busca de archivos de vídeo. """
-    for folder in folders:
-        p = Path(folder)
-        if p.is_dir():
-            for ext in VIDEO_EXTENSIONS:
-                yield from p.rglob(f'*{ext}')
+    """
+    Recorre las carpetas una sola vez (os.scandir) en busca de archivos de vídeo.
+    Devuelve VideoFile con los subtítulos del mismo directorio ya recogidos.
+    """
+    yield from walk_videos(folders, VIDEO_EXTENSIONS)
+
+def open_library_index():
+    """ Abre el índice persistente de la biblioteca dentro del directorio de cache. """
+    return LibraryIndex(os.path.join(cache_path, 'library.db'), VIDEO_EXTENSIONS)
+
+def list_videos(paths, index=None, changed_since=None, full_refresh=False):
+    """
+    Devuelve los vídeos de las rutas como VideoFile.
+    Si hay un índice de la biblioteca, se actualiza y se responde desde él; con `changed_since`
+    solo se devuelven los vídeos añadidos o modificados desde ese instante.
+    `full_refresh` vuelve a listar todos los directorios aunque su mtime no haya cambiado.
+    """
+    if index is None:
+        return list(scan_videos(paths))
+
+    stats = index.refresh(paths, full=full_refresh)
+    logging.info(f"Library index refreshed: {stats['rescanned']}/{stats['directories']} directories re-listed.")
+    return index.videos(paths, changed_since=changed_since)
+
+def compile_exclude_patterns(patterns):
+    """
+    Prepara los patrones de exclusión siguiendo las convenciones de Plex/Radarr para los extras,
+    sin distinguir mayúsculas: un archivo se excluye si su nombre es el patrón o termina en
+    '-patrón', '.patrón' o '_patrón' ('Movie-trailer', 'grupo-movie.sample'), y una carpeta
+    solo si se llama exactamente como el patrón ('Featurettes', 'Behind The Scenes').
+    Así 'Trailer.Park.Boys.S01E01' o 'The Deleted Scenes (2010)' no se excluyen.
+    Devuelve (regex del nombre del archivo, nombres de carpeta en minúsculas), o None si no hay patrones.
+    """
+    words = sorted({pattern.strip().lower() for pattern in patterns or [] if pattern and pattern.strip()})
+    if not words:
+        return None
+    suffix_regex = re.compile(r'(?:^|[-._])(?:' + '|'.join(re.escape(word) for word in words) + r')$', re.IGNORECASE)
+    return suffix_regex, frozenset(words)
+
+def _folders_below_root(video_path, roots):
+    """
+    Las carpetas entre la ruta de búsqueda que contiene el vídeo y el vídeo.
+    Sin una ruta que lo contenga, solo la carpeta del vídeo.
+    """
+    parent = os.path.abspath(video_path.parent)
+    for root in roots:
+        if parent == root or parent.startswith(root + os.sep):
+            return [name for name in parent[len(root):].split(os.sep) if name]
+    return [video_path.parent.name]
+
+def _in_extras_folder(video_path, folders, folder_names):
+    """
+    Indica si el vídeo está dentro de una carpeta de extras. Una carpeta con ese nombre que
+    contiene temporadas ('Extras/Season 1') o cuyo nombre es el principio del nombre del vídeo
+    ('Extras/Extras.S01E01.mkv') es una serie o película con ese título, no una carpeta de extras.
+    """
+    stem = video_path.stem.lower()
+    for position, name in enumerate(folders):
+        lower = name.lower()
+        if lower not in folder_names or stem.startswith(lower):
+            continue
+        if position + 1 < len(folders) and SEASON_FOLDER_PATTERN.match(folders[position + 1]):
+            continue
+        return True
+    return False
+
+def prefilter_videos(videos, min_file_size_mb=0, exclude_patterns=None, roots=None):
+    """
+    Descarta los vídeos que no vale la pena procesar antes de hashearlos o consultar proveedores:
+    los más pequeños que `min_file_size_mb`, las muestras y trailers por el final del nombre
+    ('Movie-sample') y los que están en una carpeta de extras por debajo de la ruta de búsqueda
+    (`roots`), p. ej. 'Movie/Featurettes/Disc 1' (ver compile_exclude_patterns). Sin `roots`
+    solo se mira la carpeta del vídeo.
+    Devuelve la lista filtrada y un diccionario con cuántos se han descartado por cada motivo.
+    """
+    min_size = (min_file_size_mb or 0) * 1024 * 1024
+    exclude = compile_exclude_patterns(exclude_patterns)
+    # La ruta más larga primero, por si una ruta de búsqueda está dentro de otra
+    roots = sorted({normalize_root(root) for root in roots or ()}, key=len, reverse=True)
+    kept = []
+    skipped = {'too_small': 0, 'excluded': 0}
+
+    for video in videos:
+        if exclude and (exclude[0].search(video.path.stem)
+                        or _in_extras_folder(video.path, _folders_below_root(video.path, roots), exclude[1])):
+            skipped['excluded'] += 1
+            continue
+        size = video.size if video.size is not None else video.path.stat().st_size
+        if size < min_size:
+            skipped['too_small'] += 1
+            continue
+        kept.append(video)
+    return kept, skipped
+
+def describe_skipped(skipped, min_file_size_mb):
+    """ Texto legible con el resumen de los vídeos descartados por el prefiltro. """
+    return (f"Skipped {sum(skipped.values())} file(s) before hashing: "
+            f"{skipped['too_small']} smaller than {min_file_size_mb} MB, "
+            f"{skipped['excluded']} matching exclusion patterns.")
+
+def find_missing_languages(video, languages, embedded=frozenset()):
+    """
+    Devuelve los idiomas para los que el vídeo no tiene subtítulo: ni un archivo al lado en
+    cualquier formato y variante del nombre (`.en.srt`, `.eng.ass`, `.en.forced.srt`...; ver
+    subtitle_inventory.sidecar_languages), ni una pista de `embedded` (idiomas incrustados).
+    Un `{stem}.srt` sin idioma cuenta como el primero de `languages`.
+    """
+    languages = list(languages)
+    present = present_languages(video.path, video.subtitles, languages)
+    return {lang for lang in languages if lang not in present and lang not in embedded}
+
+def inventory_embedded(videos, languages, index=None):
+    """
+    Lee de las cabeceras de los MKV los idiomas de sus pistas de subtítulos, solo para los vídeos
+    a los que aún les falta algún idioma tras mirar los archivos de al lado.
+    Con índice el resultado se guarda por ruta, tamaño y mtime, así que cada archivo se lee una
+    sola vez mientras no cambie.
+    Devuelve un diccionario {ruta (str): idiomas incrustados} para pasar a plan_searches.
+    """
+    candidates = [video for video in videos if video.path.suffix.lower() in EMBEDDED_EXTENSIONS
+                  and find_missing_languages(video, languages)]
+    embedded = index.get_embedded_languages(candidates) if index is not None else {}
+    probed = []
+    for video in candidates:
+        if str(video.path) not in embedded:
+            embedded[str(video.path)] = probe_embedded_languages(video.path)
+            probed.append((video, embedded[str(video.path)]))
+    if index is not None and probed:
+        index.store_embedded_languages(probed)
+    return embedded
+
+def plan_searches(videos, languages, index=None, embedded=None):
+    """
+    Decide qué idiomas hay que buscar para cada vídeo.
+    Los idiomas que ya se buscaron sin éxito hace poco (ver LibraryIndex.search_backoff)
+    se dejan para más adelante. `embedded` (ver inventory_embedded) da los idiomas que ya
+    están dentro del contenedor.
+    Devuelve la lista de (vídeo, idiomas a buscar) y cuántos vídeos se omiten por el backoff.
+    """
+    backoff = index.search_backoff(videos) if index is not None else {}
+    embedded = embedded or {}
+    pending = []
+    backed_off = 0
+    for video in videos:
+        missing_languages = find_missing_languages(video, languages, embedded.get(str(video.path), frozenset()))
+        if not missing_languages:
+            continue
+        due_languages = missing_languages - backoff.get(str(video.path), set())
+        if not due_languages:
+            backed_off += 1
+            continue
+        pending.append((video, due_languages))
+    return pending, backed_off
+
+def guess_show(video_path):
+    """
+    Deduce la serie y la temporada de un episodio a partir del nombre del archivo
+    ("Serie.S01E02", "Serie - 1x02"); si el nombre no incluye la serie, se toma de la carpeta
+    (saltando las carpetas "Season 1"). No usa guessit, que es demasiado lento para escanear
+    toda la biblioteca. Devuelve (serie, temporada), o (None, None) si no parece un episodio.
+    """
+    match = EPISODE_PATTERN.search(video_path.stem)
+    if not match:
+        return None, None
+    season = int(match.group('season') or match.group('season_x'))
+    show = re.sub(r'[._]+', ' ', video_path.stem[:match.start()]).strip(' -')
+    if not show:
+        parent = video_path.parent
+        if SEASON_FOLDER_PATTERN.match(parent.name):
+            parent = parent.parent
+        show = parent.name
+    return show, season
+
+def iter_media_status(paths, languages, index=None, min_file_size_mb=0, exclude_patterns=None, show=None,
+                      probe_embedded=False):
+    """
+    Escanea el estado de los subtítulos sin descargarlos, generando un registro por carpeta
+    en cuanto se ha procesado, para poder enviarlo al navegador sin esperar a toda la biblioteca.
+    Con índice las carpetas se emiten a medida que se refrescan (ver LibraryIndex.iter_refresh).
+    `show` filtra los vídeos cuya serie contiene ese texto (sin distinguir mayúsculas).
+    Con `probe_embedded` también cuentan los subtítulos incrustados en los MKV (ver inventory_embedded).
+
+    Genera diccionarios con `type`:
+      - 'directory': root, directory, videos, skipped, backoff, missing ({idioma: vídeos})
+        y shows (lista de {show, season, videos, missing}).
+      - 'error': root y error, para las rutas que no existen.
+    """
+    show_filter = show.lower() if show else None
+    for path_str in paths:
+        if not Path(path_str).is_dir():
+            yield {'type': 'error', 'root': path_str, 'error': 'Path not found or is not a directory.'}
+            continue
+
+        stats = {'directories': 0, 'rescanned': 0}
+        if index is None:
+            # walk_videos devuelve los vídeos de cada carpeta seguidos
+            directories = ((directory, list(videos)) for directory, videos
+                           in itertools.groupby(scan_videos([path_str]), key=lambda video: video.path.parent))
         else:
-            logging.warning(f"La ruta '{folder}' no existe o no es un directorio, se omitirá.")
+            directories = index.iter_refresh(path_str, stats=stats)
 
-def scan_media_status(paths, languages):
+        for directory, videos in directories:
+            videos, skipped = prefilter_videos(videos, min_file_size_mb, exclude_patterns, roots=[path_str])
+            backoff = index.search_backoff(videos) if index is not None else {}
+            embedded = inventory_embedded(videos, languages, index) if probe_embedded else {}
+            record = {'type': 'directory', 'root': path_str, 'directory': str(directory), 'videos': 0,
+                      'skipped': skipped, 'backoff': 0, 'missing': {lang: 0 for lang in languages}}
+            shows = {}
+            for video in videos:
+                show_name, season = guess_show(video.path)
+                if show_filter and (show_name is None or show_filter not in show_name.lower()):
+                    continue
+                record['videos'] += 1
+                entry = shows.get((show_name, season))
+                if entry is None:
+                    entry = shows[(show_name, season)] = {'show': show_name, 'season': season, 'videos': 0,
+                                                         'missing': {lang: 0 for lang in languages}}
+                entry['videos'] += 1
+                missing_languages = find_missing_languages(video, languages,
+                                                           embedded.get(str(video.path), frozenset()))
+                for lang in missing_languages:
+                    record['missing'][lang] += 1
+                    entry['missing'][lang] += 1
+                if missing_languages and not missing_languages - backoff.get(str(video.path), set()):
+                    record['backoff'] += 1
+            if record['videos'] or (not show_filter and sum(skipped.values())):
+                record['shows'] = list(shows.values())
+                yield record
+        if index is not None:
+            logging.info(f"Library index refreshed: {stats['rescanned']}/{stats['directories']} directories re-listed.")
+
+class MediaStatusSummary:
+    """
+    Acumula los registros de iter_media_status: totales por ruta (lo que devolvía /scan)
+    y vídeos sin subtítulo por serie, temporada e idioma.
+    """
+
+    def __init__(self, paths=()):
+        self.roots = {path: self._new_root(path) for path in paths}
+        self.shows = {}
+        self.directories = 0
+
+    @staticmethod
+    def _new_root(path):
+        return {'path': path, 'videos': 0, 'missing': 0, 'skipped': {'too_small': 0, 'excluded': 0}, 'backoff': 0}
+
+    def add(self, record):
+        if record['type'] == 'error':
+            self.roots[record['root']] = {'path': record['root'], 'error': record['error']}
+            return
+        self.directories += 1
+        root = self.roots.setdefault(record['root'], self._new_root(record['root']))
+        root['videos'] += record['videos']
+        root['missing'] += sum(record['missing'].values())
+        root['backoff'] += record['backoff']
+        for reason, count in record['skipped'].items():
+            root['skipped'][reason] += count
+        for entry in record['shows']:
+            total = self.shows.get((entry['show'], entry['season']))
+            if total is None:
+                total = self.shows[(entry['show'], entry['season'])] = {
+                    'show': entry['show'], 'season': entry['season'], 'videos': 0, 'missing': {}}
+            total['videos'] += entry['videos']
+            for lang, count in entry['missing'].items():
+                total['missing'][lang] = total['missing'].get(lang, 0) + count
+
+    def result(self):
+        # Las películas (sin serie) al final
+        shows = sorted(self.shows.values(), key=lambda entry: (entry['show'] is None, (entry['show'] or '').lower(),
+                                                               entry['season'] or 0))
+        return {'roots': list(self.roots.values()), 'shows': shows, 'directories': self.directories}
+
+def scan_media_status(paths, languages, index=None, min_file_size_mb=0, exclude_patterns=None, probe_embedded=False):
     """
     Escanea los medios para verificar el estado de los subtítulos sin descargarlos.
     Devuelve una lista de diccionarios con el estado de cada ruta.
     """
-    results = []
-    for path_str in paths:
-        path_obj = Path(path_str)
-        if not path_obj.is_dir():
-            results.append({'path': path_str, 'error': 'Path not found or is not a directory.'})
-            continue
-            
-        status = {'path': path_str, 'videos': 0, 'missing': 0}
-        video_files = scan_videos([path_str])
-        
-        for video_path in video_files:
-            status['videos'] += 1
-            for lang in languages:
-                expected_subtitle = video_path.with_name(f"{video_path.stem}.{lang}.srt")
-                if not expected_subtitle.exists():
-                    status['missing'] += 1
-        results.append(status)
-    return results
-
-def run_downloader(paths, languages, credentials=None, status_callback=None):
+    summary = MediaStatusSummary(paths)
+    for record in iter_media_status(paths, languages, index, min_file_size_mb, exclude_patterns,
+                                    probe_embedded=probe_embedded):
+        summary.add(record)
+    return summary.result()['roots']
+
+def build_provider_configs(credentials):
+    """ Construye la configuración de los proveedores que requieren autenticación. """
+    provider_configs = {}
+    if not credentials:
+        return provider_configs
+
+    # Configuración para OpenSubtitles (legacy)
+    os_legacy_creds = credentials.get('opensubtitles', {})
+    os_legacy_username = os_legacy_creds.get('username')
+    os_legacy_password = os_legacy_creds.get('password')
+
+    if os_legacy_username and os_legacy_password:
+        provider_configs['opensubtitles'] = {
+            'username': os_legacy_username, 
+            'password': os_legacy_password
+        }
+        logging.info("OpenSubtitles (legacy) credentials configured.")
+
+    # Configuración para OpenSubtitles.com (nuevo sitio)
+    os_com_creds = credentials.get('opensubtitlescom', {})
+    os_com_username = os_com_creds.get('username')
+    os_com_password = os_com_creds.get('password')
+    os_com_apikey = os_com_creds.get('api_key')
+
+    if os_com_username and os_com_apikey:
+        provider_configs['opensubtitlescom'] = {
+            'username': os_com_username,
+            'api_key': os_com_apikey
+        }
+        logging.info("OpenSubtitles.com credentials configured with API Key.")
+    elif os_com_username and os_com_password:
+        provider_configs['opensubtitlescom'] = {
+            'username': os_com_username, 
+            'password': os_com_password
+        }
+        logging.info("OpenSubtitles.com credentials configured with password.")
+
+    # Configuración para Addic7ed
+    addic7ed_creds = credentials.get('addic7ed', {})
+    addic7ed_user = addic7ed_creds.get('username')
+    addic7ed_pass = addic7ed_creds.get('password')
+    if addic7ed_user and addic7ed_pass:
+        provider_configs['addic7ed'] = {
+            'username': addic7ed_user, 
+            'password': addic7ed_pass
+        }
+        logging.info("Addic7ed credentials configured.")
+
+    return provider_configs
+
+def _synchronized_callback(status_callback):
+    """ Envuelve el callback con un lock para poder llamarlo desde varios hilos a la vez. """
+    if status_callback is None:
+        return lambda message, event_type="log": None
+
+    lock = threading.Lock()
+
+    def callback(message, event_type="log"):
+        with lock:
+            status_callback(message, event_type=event_type)
+    return callback
+
+class _ProviderPools:
+    """
+    Un ProviderPool de subliminal por hilo de trabajo, vivo durante toda la ejecución,
+    para reutilizar logins y conexiones HTTP entre vídeos en lugar de abrirlos por vídeo.
+    Siempre es un TrackedProviderPool, que indica qué proveedores fallaron en cada vídeo;
+    sin ProviderManager no se aplican límites ni circuit breaker.
+    """
+
+    def __init__(self, providers, provider_configs, provider_manager=None):
+        self.providers = providers
+        self.provider_configs = provider_configs
+        self.provider_manager = provider_manager
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pools = []
+
+    def get(self):
+        pool = getattr(self._local, 'pool', None)
+        if pool is None:
+            pool = TrackedProviderPool(self.providers, self.provider_configs, manager=self.provider_manager)
+            self._local.pool = pool
+            with self._lock:
+                self._pools.append(pool)
+        return pool
+
+    def terminate(self):
+        with self._lock:
+            for pool in self._pools:
+                pool.terminate()
+            self._pools.clear()
+
+class _Progress:
+    """ Contador de vídeos terminados que notifica la barra de progreso desde cualquier hilo. """
+
+    def __init__(self, total, report):
+        self.total = total
+        self.completed = 0
+        self._report = report
+        self._lock = threading.Lock()
+
+    def advance(self):
+        with self._lock:
+            self.completed += 1
+            self._report(f"{self.completed}/{self.total}", event_type="progress")
+
+    def extend(self, count):
+        with self._lock:
+            self.total += count
+            self._report(f"{self.completed}/{self.total}", event_type="progress")
+
+class _ArrivalWatcher:
+    """
+    Mientras dura la ejecución, refresca el índice cada `interval` segundos y mete en la cola,
+    por delante de los atrasos, los vídeos nuevos o modificados que necesitan subtítulos.
+    `on_arrival(n)` recibe cuántos vídeos se han añadido.
+    """
+
+    def __init__(self, paths, languages, index, queue, interval, on_arrival, min_file_size_mb=0,
+                 exclude_patterns=None, control=None, probe_embedded=False):
+        self.paths = paths
+        self.languages = languages
+        self.index = index
+        self.queue = queue
+        self.interval = interval
+        self.on_arrival = on_arrival
+        self.min_file_size_mb = min_file_size_mb
+        self.exclude_patterns = exclude_patterns
+        self.control = control
+        self.probe_embedded = probe_embedded
+        self._last_check = time.time()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="subtitlarr-arrivals", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logging.warning(f"Could not check for new videos: {e}")
+
+    def check(self):
+        since = self._last_check
+        self._last_check = time.time()
+        self.index.refresh(self.paths)
+        videos, _ = prefilter_videos(self.index.videos(self.paths, changed_since=since),
+                                     self.min_file_size_mb, self.exclude_patterns, roots=self.paths)
+        embedded = inventory_embedded(videos, self.languages, self.index) if self.probe_embedded else None
+        pending, _ = plan_searches(videos, self.languages, index=self.index, embedded=embedded)
+        added = 0
+        for video_file, missing_languages in pending:
+            if self.control is not None and self.control.is_done(video_file.path):
+                continue
+            if self.queue.put(video_file, missing_languages, arrived=True):
+                added += 1
+        if added:
+            self.on_arrival(added)
+        return added
+
+def load_video(video_file, providers, index=None):
+    """
+    Devuelve el Video de subliminal de un archivo con los hashes que usan los proveedores.
+    Con índice, el resultado se guarda por ruta, tamaño y mtime: mientras el archivo no cambie
+    no se vuelve a analizar el nombre con guessit ni a leer el archivo para calcular el hash.
+    """
+    stored = index.get_scanned_video(video_file) if index is not None else None
+    if stored is not None:
+        video, hashed_for = stored
+        missing_providers = [name for name in providers if name not in hashed_for]
+        if not missing_providers:
+            return video
+    else:
+        video = subliminal.scan_video(str(video_file.path))
+        hashed_for, missing_providers = set(), list(providers)
+
+    if video.size and video.size > HASH_MIN_SIZE:
+        subliminal.refine(video, refiners=['hash'], providers=missing_providers)
+    if index is not None:
+        index.store_scanned_video(video_file, video, hashed_for | set(missing_providers))
+    return video
+
+def _process_video(video_file, missing_languages, pool, report, run_metrics, index=None, on_video=None):
+    """
+    Busca y guarda los subtítulos que faltan para un único vídeo usando el pool del hilo.
+    Registra en `run_metrics` el tiempo de cada etapa (hash, consulta, descarga, guardado).
+    Si hay índice, registra los idiomas sin resultados para aplicarles el backoff, pero solo
+    si algún proveedor respondió; si alguno falló, solo se borran los idiomas encontrados.
+    Si ninguno respondió (todos fallaron o tenían el circuito abierto) el vídeo cuenta como error.
+    `on_video(ruta, subtítulos guardados, error)` recibe el resultado de cada vídeo.
+    Devuelve el número de subtítulos guardados.
+    """
+    video_path = video_file.path
+    report(f"Processing: {video_path.name}", event_type="log")
+    # El pool vive toda la ejecución y subliminal no vuelve a usar un proveedor descartado:
+    # un error puntual solo afecta a este vídeo; las caídas reales las corta el circuit breaker
+    pool.discarded_providers.clear()
+
+    try:
+        with run_metrics.stage('hash'):
+            video = load_video(video_file, pool.providers, index=index)
+        wanted = {Language.fromalpha2(lang) for lang in missing_languages}
+        if not subliminal.check_video(video, languages=wanted):
+            run_metrics.count('rejected')
+            return 0
+
+        with run_metrics.stage('query'):
+            listed = pool.list_subtitles(video, wanted)
+        if not pool.answered_providers:
+            failed = ', '.join(sorted(pool.failed_providers)) or 'none available'
+            raise ProvidersUnavailable(f"no provider answered (failed: {failed})")
+        with run_metrics.stage('download'):
+            subtitles = pool.download_best_subtitles(listed, video, wanted)
+        with run_metrics.stage('save'):
+            saved = subliminal.save_subtitles(video, subtitles) if subtitles else []
+        run_metrics.record_video(missing_languages, listed, saved)
+        if index is not None:
+            found = {subtitle.language.alpha2 for subtitle in saved}
+            # Un "sin resultados" con algún proveedor caído no es fiable: no se aplica backoff
+            index.record_search(video_file, found if pool.failed_providers else missing_languages, found)
+        if saved:
+            saved_count = len(saved)
+            arrived = arrival_time(video_file)
+            if arrived and time.time() - arrived <= NEW_MEDIA_MAX_AGE:
+                run_metrics.record_time_to_subtitle(time.time() - arrived)
+            logging.info(f"SUCCESS: Saved {saved_count} new subtitle(s) for {video_path.name}")
+            report(f"SUCCESS: Found {saved_count} subtitles for {video_path.name}", event_type="log")
+            if on_video is not None:
+                on_video(video_path, saved_count, None)
+            return saved_count
+
+    except Exception as e:
+        logging.error(f"An error occurred while processing {video_path.name}: {e}")
+        report(f"ERROR processing {video_path.name}: {e}", event_type="log")
+        run_metrics.record_video(missing_languages, error=e)
+        if on_video is not None:
+            on_video(video_path, 0, e)
+    return 0
+
+def _process_batch(queue, batch_size, batch_number, pools, report, progress, run_metrics, index=None,
+                   control=None, on_video=None):
+    """
+    Procesa hasta `batch_size` vídeos de la cola con el pool de proveedores del hilo y notifica su duración.
+    Los vídeos se sacan de la cola de uno en uno, así que los que llegan durante la ejecución
+    se atienden en cuanto un hilo termina el vídeo en curso.
+    Con un control de trabajo, espera mientras está en pausa y se detiene si se cancela.
+    Devuelve el número de vídeos procesados (0 si la cola estaba vacía).
+    """
+    start = time.perf_counter()
+    pool = pools.get()
+    saved_count = 0
+    processed = 0
+    while processed < batch_size:
+        if control is not None:
+            control.wait()
+        item = queue.get()
+        if item is None:
+            break
+        video_file, missing_languages = item
+        saved = _process_video(video_file, missing_languages, pool, report, run_metrics, index=index,
+                               on_video=on_video)
+        saved_count += saved
+        processed += 1
+        progress.advance()
+        if control is not None:
+            control.video_done(video_file.path, saved)
+
+    if processed:
+        elapsed = time.perf_counter() - start
+        report(f"Batch {batch_number}: {processed} video(s) in {elapsed:.1f}s ({elapsed / processed:.2f}s per video), "
+               f"{saved_count} subtitle(s) saved, {len(queue)} video(s) still queued.", event_type="log")
+    return processed
+
+def _run_worker(queue, batch_size, batch_numbers, *args):
+    """ Hilo de trabajo: procesa lotes de la cola compartida hasta vaciarla. """
+    while _process_batch(queue, batch_size, next(batch_numbers), *args):
+        pass
+
+def run_downloader(paths, languages, credentials=None, status_callback=None, max_workers=1, providers=None,
+                   index=None, min_file_size_mb=0, exclude_patterns=None, batch_size=DEFAULT_BATCH_SIZE,
+                   changed_since=None, full_refresh=False, provider_manager=None, control=None, on_video=None,
+                   run_metrics=None, priority=DEFAULT_PRIORITY, arrival_check_minutes=0, videos=None,
+                   probe_embedded=False):
     """
     Ejecuta el proceso de descarga de subtítulos.
     Acepta credenciales para los providers y un callback para notificar el estado.
+    Los vídeos se procesan en paralelo con hasta `max_workers` hilos y, si se pasa
+    un LibraryIndex, la lista de vídeos sale del índice en lugar de recorrer el disco.
+    Antes de hashear nada se descartan muestras, extras y archivos pequeños (ver prefilter_videos).
+    Un subtítulo ya existente en cualquier formato y variante del nombre evita la búsqueda; con
+    `probe_embedded` también uno incrustado en el MKV (ver inventory_embedded).
+    Los vídeos pendientes se atienden según `priority` (ver work_queue.PRIORITIES; por defecto
+    los más recientes primero) desde una cola compartida, en lotes de `batch_size`; cada hilo
+    mantiene un único pool de proveedores durante toda la ejecución.
+    Con índice y `arrival_check_minutes`, los vídeos que llegan mientras tanto se cuelan por
+    delante del resto de la cola.
+    Con `changed_since` (requiere índice) solo se procesan los vídeos nuevos o modificados.
+    Con un ProviderManager los proveedores se consultan en el orden de su historial (los de peor
+    historial solo si los mejores no encuentran todos los idiomas), se saltan en cada petición
+    mientras tienen el circuito abierto y se respetan sus límites de peticiones.
+    Si hay vídeos pendientes pero ningún proveedor disponible (todos con el circuito abierto al
+    empezar), lanza providers.ProvidersUnavailable sin buscar nada.
+    Con un `control` (jobs.JobControl) la ejecución se puede pausar y cancelar, y se saltan
+    los vídeos que ya procesó antes de un reinicio.
+    `on_video(ruta, subtítulos guardados, error)` se llama tras cada vídeo, desde los hilos de trabajo.
+    Con `videos` (lista de VideoFile) no se listan las rutas: se procesan solo esos vídeos.
+    Devuelve un resumen estructurado (ver metrics.RunMetrics.summary): tiempo por etapa,
+    recuentos por proveedor e idioma y el tiempo hasta subtítulo de los vídeos nuevos. Se puede pasar un `run_metrics` propio para poder
+    consultarlo también si la ejecución se cancela o falla.
     """
-    if status_callback:
-        status_callback("Starting scan and download process...", event_type="log")
+    run_metrics = run_metrics or RunMetrics()
+    queue = WorkQueue(priority)
+    report = _synchronized_callback(status_callback)
+    report("Starting scan and download process...", event_type="log")
+    if not region.is_configured:
+        configure_cache()
+
+    # Lista de proveedores a usar (por defecto ambos OpenSubtitles y el resto)
+    providers = list(providers or DEFAULT_PROVIDERS)
+    provider_configs = build_provider_configs(credentials)
+    cooling_down = []
+    if provider_manager is not None:
+        providers = provider_manager.plan(providers)
+        report(f"Provider order for this run: {', '.join(providers) or 'none'}.", event_type="log")
+        # Se vuelven a consultar en cuanto termina su enfriamiento (ProviderManager.allow)
+        cooling_down = provider_manager.cooling_down(providers)
+        if cooling_down:
+            report(f"Skipping unhealthy provider(s) until their cooldown ends: {', '.join(cooling_down)}.",
+                   event_type="log")
+
+    with run_metrics.stage('walk'):
+        if videos is None:
+            videos = list_videos(paths, index=index, changed_since=changed_since, full_refresh=full_refresh)
+        else:
+            videos = list(videos)
+    run_metrics.count('listed', len(videos))
+    if changed_since is not None and index is not None:
+        report(f"Incremental run: {len(videos)} video(s) added or changed since the last run.", event_type="log")
+    with run_metrics.stage('prefilter'):
+        videos_to_scan, skipped = prefilter_videos(videos, min_file_size_mb, exclude_patterns, roots=paths)
+    for reason, count in skipped.items():
+        run_metrics.count(reason, count)
+    if any(skipped.values()):
+        report(describe_skipped(skipped, min_file_size_mb), event_type="log")
+
+    # Comprueba qué subtítulos faltan antes de hacer ninguna búsqueda
+    embedded = None
+    if probe_embedded:
+        with run_metrics.stage('inventory'):
+            embedded = inventory_embedded(videos_to_scan, languages, index=index)
+        with_tracks = sum(1 for found in embedded.values() if found)
+        if with_tracks:
+            report(f"{with_tracks} of {len(embedded)} MKV file(s) checked have embedded subtitles.", event_type="log")
+    with run_metrics.stage('plan'):
+        pending, backed_off = plan_searches(videos_to_scan, languages, index=index, embedded=embedded)
+    run_metrics.count('backed_off', backed_off)
+    run_metrics.count('up_to_date', len(videos_to_scan) - len(pending) - backed_off)
+    report(f"{len(pending)} of {len(videos_to_scan)} video(s) need a subtitle search.", event_type="log")
+    if backed_off:
+        report(f"Skipped {backed_off} video(s) with no subtitles found in recent searches (retry backoff).",
+               event_type="log")
+    if pending and len(cooling_down) == len(providers):
+        # Buscar sin proveedores guardaría cada vídeo como "sin resultados" en el backoff
+        raise ProvidersUnavailable("No subtitle provider is available (all skipped as unhealthy or none configured).")
+
+    if control is not None:
+        remaining = [(video_file, missing) for video_file, missing in pending if not control.is_done(video_file.path)]
+        if len(remaining) < len(pending):
+            report(f"Resuming job: {len(pending) - len(remaining)} video(s) already processed before the restart.",
+                   event_type="log")
+        pending = remaining
+        control.begin(len(pending))
+
+    for video_file, missing_languages in pending:
+        queue.put(video_file, missing_languages)
+
+    workers = max(1, int(max_workers or 1))
+    # Lotes más pequeños si no hay trabajo suficiente para mantener ocupados a todos los hilos
+    batch_size = max(1, min(int(batch_size or 1), -(-len(pending) // workers)))
 
-    # Define la lista de proveedores a usar (incluyendo ambos OpenSubtitles)
-    providers = ['opensubtitles', 'opensubtitlescom', 'addic7ed', 'podnapisi', 'tvsubtitles']
-    
-    # Construye la configuración para los proveedores que requieren autenticación
-    provider_configs = {}
-    if credentials:
-        # Configuración para OpenSubtitles (legacy)
-        os_legacy_creds = credentials.get('opensubtitles', {})
-        os_legacy_username = os_legacy_creds.get('username')
-        os_legacy_password = os_legacy_creds.get('password')
-        
-        if os_legacy_username and os_legacy_password:
-            provider_configs['opensubtitles'] = {
-                'username': os_legacy_username, 
-                'password': os_legacy_password
-            }
-            logging.info("OpenSubtitles (legacy) credentials configured.")
-        
-        # Configuración para OpenSubtitles.com (nuevo sitio)
-        os_com_creds = credentials.get('opensubtitlescom', {})
-        os_com_username = os_com_creds.get('username')
-        os_com_password = os_com_creds.get('password')
-        os_com_apikey = os_com_creds.get('api_key')
-
-        if os_com_username and os_com_apikey:
-            provider_configs['opensubtitlescom'] = {
-                'username': os_com_username,
-                'api_key': os_com_apikey
-            }
-            logging.info("OpenSubtitles.com credentials configured with API Key.")
-        elif os_com_username and os_com_password:
-            provider_configs['opensubtitlescom'] = {
-                'username': os_com_username, 
-                'password': os_com_password
-            }
-            logging.info("OpenSubtitles.com credentials configured with password.")
-        
-        # Configuración para Addic7ed
-        addic7ed_creds = credentials.get('addic7ed', {})
-        addic7ed_user = addic7ed_creds.get('username')
-        addic7ed_pass = addic7ed_creds.get('password')
-        if addic7ed_user and addic7ed_pass:
-            provider_configs['addic7ed'] = {
-                'username': addic7ed_user, 
-                'password': addic7ed_pass
-            }
-            logging.info("Addic7ed credentials configured.")
-            
-    videos_to_scan = list(scan_videos(paths))
-    total_videos = len(videos_to_scan)
-    
     # Notifica el total para la barra de progreso al inicio
-    if status_callback:
-        status_callback(f"0/{total_videos}", event_type="progress")
-
-    for i, video_path in enumerate(videos_to_scan):
-        # Envía el progreso y el log para cada vídeo
-        if status_callback:
-            status_callback(f"Processing: {video_path.name}", event_type="log")
-            status_callback(f"{i+1}/{total_videos}", event_type="progress")
-        
-        # Comprueba qué subtítulos faltan antes de hacer la búsqueda
-        missing_languages = set()
-        for lang in languages:
-            expected_subtitle = video_path.with_name(f"{video_path.stem}.{lang}.srt")
-            if not expected_subtitle.exists():
-                missing_languages.add(lang)
-        
-        if not missing_languages:
+    progress = _Progress(len(pending), report)
+    report(f"0/{len(pending)}", event_type="progress")
+    if pending:
+        report(f"Using {workers} concurrent worker(s) in batches of up to {batch_size} video(s), "
+               f"priority: {priority}.", event_type="log")
+
+    def on_arrival(count):
+        run_metrics.count('arrived', count)
+        progress.extend(count)
+        if control is not None:
+            control.extend(count)
+        report(f"{count} new video(s) arrived; queued ahead of the backlog.", event_type="log")
+
+    watcher = None
+    if index is not None and arrival_check_minutes and pending:
+        watcher = _ArrivalWatcher(paths, languages, index, queue, arrival_check_minutes * 60, on_arrival,
+                                  min_file_size_mb, exclude_patterns, control, probe_embedded)
+        watcher.start()
+
+    pools = _ProviderPools(providers, provider_configs, provider_manager)
+    batch_numbers = itertools.count(1)
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="subtitlarr-worker") as executor:
+            futures = [
+                executor.submit(_run_worker, queue, batch_size, batch_numbers, pools, report, progress, run_metrics,
+                                index, control, on_video)
+                for _ in range(workers)
+            ]
+            for future in as_completed(futures):
+                future.result()
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        pools.terminate()
+        if provider_manager is not None:
+            provider_manager.save()
+
+    summary = run_metrics.summary(status='finished')
+    logging.info(format_summary(summary))
+    report(format_summary(summary), event_type="log")
+    report("Scan and download finished.", event_type="log")
+    return summary
+
+# --- Modo por lotes (CLI) ---
+
+def report_missing_subtitles(paths, languages, index=None, min_file_size_mb=0, exclude_patterns=None, output=print,
+                             probe_embedded=False):
+    """
+    Informa de los subtítulos que faltan sin buscar ninguno (--dry-run): una línea por carpeta
+    incompleta y los totales por ruta y por serie.
+    Devuelve el código de salida: 0 si no falta ninguno, 1 si faltan y 2 si alguna ruta no se puede leer.
+    """
+    summary = MediaStatusSummary(paths)
+    for record in iter_media_status(paths, languages, index, min_file_size_mb, exclude_patterns,
+                                    probe_embedded=probe_embedded):
+        summary.add(record)
+        if record['type'] == 'error':
+            output(f"ERROR: {record['root']}: {record['error']}")
+        elif any(record['missing'].values()):
+            output(f"{record['directory']}: {_describe_missing(record['missing'])}")
+
+    result = summary.result()
+    for entry in result['shows']:
+        if any(entry['missing'].values()):
+            name = entry['show'] if entry['show'] is not None else 'Movies'
+            season = f" season {entry['season']}" if entry['season'] is not None else ''
+            output(f"{name}{season}: {_describe_missing(entry['missing'])} ({entry['videos']} video(s))")
+    missing = 0
+    failed = False
+    for root in result['roots']:
+        if 'error' in root:
+            failed = True
             continue
+        missing += root['missing']
+        output(f"{root['path']}: {root['videos']} video(s), {root['missing']} missing subtitle(s), "
+               f"{root['backoff']} waiting for a retry.")
+    if failed:
+        return 2
+    return 1 if missing else 0
 
-        # Llama a subliminal solo si faltan subtítulos
-        try:
-            video = subliminal.scan_video(str(video_path))
-            subtitles = subliminal.download_best_subtitles(
-                videos=[video], 
-                languages={Language.fromalpha2(lang) for lang in missing_languages},
-                providers=providers,
-                provider_configs=provider_configs
-            )
-            
-            if subtitles[video]:
-                saved_count = len(subliminal.save_subtitles(video, subtitles[video]))
-                logging.info(f"SUCCESS: Saved {saved_count} new subtitle(s) for {video_path.name}")
-                if status_callback:
-                    status_callback(f"SUCCESS: Found {saved_count} subtitles for {video_path.name}", event_type="log")
-            
-        except Exception as e:
-            logging.error(f"An error occurred while processing {video_path.name}: {e}")
-            if status_callback:
-                status_callback(f"ERROR processing {video_path.name}: {e}", event_type="log")
-    
-    if status_callback:
-        status_callback("Scan and download finished.", event_type="log")
+def _describe_missing(missing):
+    return ", ".join(f"{count} missing {lang}" for lang, count in missing.items() if count)
+
+# --- Descargas masivas en varios procesos ---
+
+def shard_videos(pending, shards):
+    """
+    Reparte los (vídeo, idiomas) pendientes en hasta `shards` grupos de tamaño parecido.
+    Los vídeos de una misma carpeta van siempre al mismo grupo, así cada proceso
+    aprovecha su cache de subliminal para los episodios de una serie.
+    """
+    directories = {}
+    for item in pending:
+        directories.setdefault(item[0].path.parent, []).append(item)
+    groups = [[] for _ in range(max(1, shards))]
+    for _, items in sorted(directories.items(), key=lambda entry: (-len(entry[1]), str(entry[0]))):
+        min(groups, key=len).extend(items)
+    return [group for group in groups if group]
+
+class _ShardControl(JobControl):
+    """ JobControl que además envía al proceso principal cada vídeo terminado. """
+
+    def __init__(self, results):
+        super().__init__()
+        self._results = results
+
+    def video_done(self, path, saved_count=0):
+        super().video_done(path, saved_count)
+        self._results.put((str(path), saved_count))
+
+# Estado de cada proceso de trabajo, preparado por _init_shard_process
+_shard_state = {}
+
+def _init_shard_process(cache_settings, use_index, rate_limiter, results):
+    """ Inicializa un proceso de trabajo: cache de subliminal, índice y limitador compartido. """
+    logging.getLogger().setLevel(logging.WARNING)
+    configure_cache(*cache_settings)
+    _shard_state.update(index=open_library_index() if use_index else None, rate_limiter=rate_limiter,
+                        results=results)
+
+def _run_shard(shard_number, paths, videos, languages, credentials, options):
+    """ Ejecuta run_downloader sobre una parte de la biblioteca; devuelve su resumen. """
+    def report(message, event_type="log"):
+        if event_type == "log":
+            # Una sola escritura por mensaje para que no se mezcle con las de otros hilos
+            sys.stdout.write("".join(f"[{shard_number}] {line}\n" for line in message.splitlines()))
+            sys.stdout.flush()
+
+    # Sin state_path: el archivo de estadísticas es de la aplicación web, no de los procesos de trabajo
+    provider_manager = ProviderManager(rate_limits=options['rate_limits'], rate_limiter=_shard_state['rate_limiter'])
+    return run_downloader(paths, languages, credentials=credentials, status_callback=report,
+                          max_workers=options['workers'], providers=options['providers'], index=_shard_state['index'],
+                          batch_size=options['batch_size'], provider_manager=provider_manager,
+                          control=_ShardControl(_shard_state['results']), priority=options['priority'],
+                          videos=videos, probe_embedded=options['probe_embedded'])
+
+def _merge_summaries(summaries):
+    """ Suma los recuentos de los resúmenes de cada proceso. """
+    merged = {'processes': len(summaries), 'saved_count': 0, 'videos': {}}
+    for summary in summaries:
+        merged['saved_count'] += summary['saved_count']
+        for name, count in summary['videos'].items():
+            merged['videos'][name] = merged['videos'].get(name, 0) + count
+    return merged
+
+def run_backfill(paths, languages, processes=2, credentials=None, status_callback=None, workers_per_process=1,
+                 use_index=True, min_file_size_mb=0, exclude_patterns=None, batch_size=DEFAULT_BATCH_SIZE,
+                 priority=DEFAULT_PRIORITY, rate_limits=None, progress_path=None, providers=None,
+                 probe_embedded=False):
+    """
+    Descarga masiva para la carga inicial de bibliotecas grandes.
+    Lista y planifica los vídeos una sola vez y reparte los pendientes entre `processes`
+    procesos (ver shard_videos), cada uno con `workers_per_process` hilos. Los límites de
+    peticiones por proveedor (`rate_limits`, peticiones por minuto) se comparten entre todos.
+    Con `progress_path` los vídeos terminados se guardan en ese archivo: si la descarga se
+    interrumpe, la siguiente los salta; el archivo se borra al terminar sin errores.
+    Usa el cache configurado con configure_cache. Devuelve los recuentos sumados de todos los
+    procesos y `failed`, el número de procesos que terminaron con error.
+    """
+    report = _synchronized_callback(status_callback)
+    index = open_library_index() if use_index else None
+    videos, skipped = prefilter_videos(list_videos(paths, index=index), min_file_size_mb, exclude_patterns,
+                                       roots=paths)
+    if any(skipped.values()):
+        report(describe_skipped(skipped, min_file_size_mb), event_type="log")
+    embedded = inventory_embedded(videos, languages, index=index) if probe_embedded else None
+    pending, backed_off = plan_searches(videos, languages, index=index, embedded=embedded)
+    if backed_off:
+        report(f"Skipped {backed_off} video(s) with no subtitles found in recent searches (retry backoff).",
+               event_type="log")
+
+    progress = ProgressFile(progress_path, paths, languages) if progress_path else None
+    if progress is not None and progress.load():
+        remaining = [item for item in pending if str(item[0].path) not in progress.done]
+        report(f"Resuming backfill: {len(pending) - len(remaining)} video(s) already processed.", event_type="log")
+        pending = remaining
+
+    shards = shard_videos(pending, processes)
+    report(f"{len(pending)} of {len(videos)} video(s) need a subtitle search; "
+           f"using {len(shards)} process(es) with {workers_per_process} worker(s) each.", event_type="log")
+    if not shards:
+        if progress is not None:
+            progress.remove()
+        return {'processes': 0, 'saved_count': 0, 'videos': {}, 'failed': 0}
+
+    context = multiprocessing.get_context()
+    rate_limiter = SharedRateLimiter(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits, context)
+    results = context.Queue() if len(shards) > 1 else queue_module.Queue()
+    options = {'workers': workers_per_process, 'batch_size': batch_size, 'priority': priority,
+               'rate_limits': rate_limiter.rate_limits, 'providers': providers, 'probe_embedded': probe_embedded}
+    initargs = (cache_settings, use_index, rate_limiter, results)
+
+    completed = itertools.count(1)
+
+    def collect():
+        # Guarda el progreso de todos los procesos desde un único sitio
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            if progress is not None:
+                progress.add(item[0])
+            done = next(completed)
+            if done % 100 == 0 or done == len(pending):
+                report(f"Backfill progress: {done}/{len(pending)} video(s).", event_type="log")
+    collector = threading.Thread(target=collect, name="subtitlarr-backfill-progress", daemon=True)
+    collector.start()
+
+    summaries = []
+    failed = 0
+    try:
+        if len(shards) == 1:
+            _init_shard_process(*initargs)
+            summaries.append(_run_shard(1, paths, [video for video, _ in shards[0]], languages, credentials, options))
+        else:
+            with ProcessPoolExecutor(max_workers=len(shards), mp_context=context, initializer=_init_shard_process,
+                                     initargs=initargs) as executor:
+                futures = [
+                    executor.submit(_run_shard, number, paths, [video for video, _ in shard], languages,
+                                    credentials, options)
+                    for number, shard in enumerate(shards, start=1)
+                ]
+                for future in as_completed(futures):
+                    try:
+                        summaries.append(future.result())
+                    except Exception as e:
+                        failed += 1
+                        report(f"ERROR: a backfill process failed: {e}", event_type="log")
+    finally:
+        results.put(None)
+        collector.join()
+        if progress is not None:
+            progress.save()
+
+    if progress is not None and not failed:
+        progress.remove()
+    merged = _merge_summaries(summaries)
+    merged['failed'] = failed
+    return merged
 
 
 # --- Bloque de ejecución para modo Standalone ---
@@ -168,6 +1024,35 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Downloads subtitles for video files in standalone mode.")
     parser.add_argument('folders', nargs='+', help='One or more folders to scan for videos.')
     parser.add_argument('-l', '--languages', nargs='+', required=True, help="Languages to download (e.g., en es).")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help=f'Cache directory (default: {DEFAULT_CACHE_PATH}).')
+    parser.add_argument('--cache-backend', choices=list(CACHE_BACKENDS), default='memory',
+                        help='Subliminal cache backend (default: memory, an LRU in front of SQLite).')
+    parser.add_argument('--no-index', action='store_true', help='Walk the folders instead of using the persistent library index.')
+    parser.add_argument('--min-size', type=int, default=50, help='Skip videos smaller than this many MB (default: 50).')
+    parser.add_argument('--exclude', nargs='*', default=DEFAULT_EXCLUDE_PATTERNS,
+                        help='Skip videos whose name ends in -WORD (e.g. Movie-trailer) or that are in a folder named WORD '
+                             '(e.g. Featurettes) (default: sample, trailer, extras...).')
+    parser.add_argument('-w', '--workers', type=int, default=2, help='Number of videos processed concurrently (default: 2).')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Videos handled per provider session batch (default: {DEFAULT_BATCH_SIZE}).')
+    parser.add_argument('--priority', choices=PRIORITIES, default=DEFAULT_PRIORITY,
+                        help=f'Order in which videos are searched (default: {DEFAULT_PRIORITY}).')
+    parser.add_argument('--arrival-check-minutes', type=float, default=0,
+                        help='Look for new videos every N minutes while running and search them first (needs the index; default: off).')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Split the videos across this many processes, each running --workers threads, '
+                             'for large backfills (default: 1).')
+    parser.add_argument('--progress-file',
+                        help='Where a backfill records the videos it processed, to resume after an interruption '
+                             '(default with --processes: backfill_progress.json in the cache directory).')
+    parser.add_argument('--rate-limit', nargs='*', metavar='PROVIDER=PER_MINUTE',
+                        help='Requests per minute per provider, shared by all processes '
+                             '(default: ' + ', '.join(f'{name}={limit}' for name, limit in DEFAULT_RATE_LIMITS.items()) + ').')
+    parser.add_argument('--probe-embedded', action='store_true',
+                        help='Also count subtitle tracks embedded in MKV files, read from their headers.')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='Only report the missing subtitles. Exit status: 0 if none are missing, '
+                             '1 if some are, 2 if a folder cannot be read.')
     
     # Argumentos opcionales para credenciales
     parser.add_argument('--opensubtitles-username', help='Username for OpenSubtitles (legacy).')
@@ -197,11 +1082,54 @@ if __name__ == '__main__':
         }
     }
 
-    # Callback para imprimir el estado en la consola
-    def console_status_callback(message):
-        print(message)
+    # Callback para imprimir el estado en la consola; el progreso vídeo a vídeo no se imprime
+    # (ya hay una línea por lote) para no llenar los logs de cron
+    def console_status_callback(message, event_type="log"):
+        if event_type == "log":
+            print(message, flush=True)
+
+    rate_limits = dict(DEFAULT_RATE_LIMITS)
+    for entry in args.rate_limit or []:
+        provider, _, limit = entry.partition('=')
+        try:
+            rate_limits[provider] = float(limit)
+        except ValueError:
+            parser.error(f"Invalid --rate-limit '{entry}'; expected PROVIDER=REQUESTS_PER_MINUTE.")
+
+    configure_cache(args.cache_path, args.cache_backend)
+    library_index = None
+    if not args.no_index:
+        library_index = open_library_index()
+
+    if args.dry_run:
+        sys.exit(report_missing_subtitles(args.folders, args.languages, library_index,
+                                          min_file_size_mb=args.min_size, exclude_patterns=args.exclude,
+                                          probe_embedded=args.probe_embedded))
 
     print(f"Standalone Mode: Scanning folders {args.folders} for languages {args.languages}")
-    run_downloader(args.folders, args.languages, credentials=cli_credentials, status_callback=console_status_callback)
+    if args.processes > 1 or args.progress_file:
+        progress_file = args.progress_file or os.path.join(cache_path, 'backfill_progress.json')
+        result = run_backfill(args.folders, args.languages, processes=args.processes, credentials=cli_credentials,
+                              status_callback=console_status_callback, workers_per_process=args.workers,
+                              use_index=not args.no_index, min_file_size_mb=args.min_size,
+                              exclude_patterns=args.exclude, batch_size=args.batch_size, priority=args.priority,
+                              rate_limits=rate_limits, progress_path=progress_file,
+                              probe_embedded=args.probe_embedded)
+        print(f"Backfill finished: {result['videos'].get('searched', 0)} video(s) searched, "
+              f"{result['saved_count']} subtitle(s) saved, {result['videos'].get('errors', 0)} error(s).")
+        if result['failed']:
+            print(f"{result['failed']} process(es) failed; run the same command again to resume from {progress_file}.")
+            sys.exit(1)
+    else:
+        provider_manager = ProviderManager(rate_limits=rate_limits)
+        try:
+            run_downloader(args.folders, args.languages, credentials=cli_credentials,
+                           status_callback=console_status_callback, max_workers=args.workers, index=library_index,
+                           min_file_size_mb=args.min_size, exclude_patterns=args.exclude, batch_size=args.batch_size,
+                           priority=args.priority, arrival_check_minutes=args.arrival_check_minutes,
+                           provider_manager=provider_manager, probe_embedded=args.probe_embedded)
+        except ProvidersUnavailable as e:
+            print(f"Aborted: {e}")
+            sys.exit(1)
 
     print("Standalone process finished.")
\ No newline at end of file
@@ -0,0 +1,167 @@
+# subtitlarr/events.py
+import itertools
+import json
+import threading
+import time
+from collections import deque
+
+DEFAULT_BUFFER_SIZE = 500
+DEFAULT_HISTORY_SIZE = 1000
+# Minimum time between two progress updates sent to the same client.
+PROGRESS_INTERVAL_SECONDS = 0.5
+HEARTBEAT_SECONDS = 15
+
+
+class Subscriber:
+    """
+    One connected SSE client.
+
+    Log and status events go to a bounded ring buffer (the oldest are dropped if the client
+    cannot keep up). Progress events are coalesced into a single slot that only keeps the
+    latest value, and are released at most every PROGRESS_INTERVAL_SECONDS.
+    """
+
+    def __init__(self, buffer_size):
+        self._buffer = deque(maxlen=buffer_size)
+        self._progress = None
+        self._last_progress_sent = 0.0
+        self._condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, event):
+        with self._condition:
+            if event['type'] == 'progress':
+                self._progress = event
+            else:
+                if len(self._buffer) == self._buffer.maxlen:
+                    self.dropped += 1
+                self._buffer.append(event)
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+    def _progress_due(self, now):
+        return self._progress is not None and now - self._last_progress_sent >= PROGRESS_INTERVAL_SECONDS
+
+    def get(self, timeout):
+        """
+        Waits for pending events.
+
+        Returns:
+            list: The pending events (empty on timeout), or None once the subscriber is closed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while True:
+                if self.closed:
+                    return None
+                now = time.monotonic()
+                # A pending status (e.g. 'finished') flushes the latest progress with it
+                if self._buffer or self._progress_due(now):
+                    break
+                remaining = deadline - now
+                if remaining <= 0:
+                    return []
+                if self._progress is not None:
+                    remaining = min(remaining, self._last_progress_sent + PROGRESS_INTERVAL_SECONDS - now)
+                self._condition.wait(max(remaining, 0.01))
+
+            events = []
+            if self._progress is not None:
+                events.append(self._progress)
+                self._progress = None
+                self._last_progress_sent = now
+            events.extend(self._buffer)
+            self._buffer.clear()
+            return events
+
+
+class EventBroadcaster:
+    """
+    Fans status events out to every connected SSE client.
+
+    Log events are numbered and kept in a bounded history: new clients get it replayed,
+    and reconnecting EventSource clients (Last-Event-ID) only get what they missed.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, history_size=DEFAULT_HISTORY_SIZE):
+        self.buffer_size = buffer_size
+        self.history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, event_type, message):
+        """Sends an event to every subscriber; log events are also added to the history."""
+        event = {'type': event_type, 'message': message}
+        with self._lock:
+            if event_type == 'log':
+                event['id'] = next(self._ids)
+                self.history.append((event['id'], f"[{time.strftime('%H:%M:%S')}] {message}"))
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(event)
+
+    def subscribe(self, since=0):
+        """
+        Registers a new client.
+
+        Args:
+            since (int, optional): Id of the last log event the client already has.
+
+        Returns:
+            tuple: The Subscriber and the history entries (id, text) to replay.
+        """
+        subscriber = Subscriber(self.buffer_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            replay = [(event_id, entry) for event_id, entry in self.history if event_id > since]
+        return subscriber, replay
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def history_snapshot(self):
+        """Returns a copy of the log history as a list of (id, text)."""
+        with self._lock:
+            return list(self.history)
+
+    def stream(self, since=0, heartbeat=HEARTBEAT_SECONDS):
+        """
+        Generator of SSE frames for one client.
+
+        Sends a comment line every `heartbeat` seconds of silence; writing it to a closed
+        connection raises inside the generator, which then releases the subscriber.
+        """
+        subscriber, replay = self.subscribe(since)
+        try:
+            for event_id, entry in replay:
+                yield _format({'type': 'replay', 'message': entry, 'id': event_id})
+            while True:
+                events = subscriber.get(heartbeat)
+                if events is None:
+                    return
+                if not events:
+                    yield ": keep-alive\n\n"
+                    continue
+                for event in events:
+                    yield _format(event)
+        finally:
+            self.unsubscribe(subscriber)
+
+
+def _format(event):
+    frame = f"data: {json.dumps({'type': event['type'], 'message': event['message']})}\n\n"
+    if 'id' in event:
+        frame = f"id: {event['id']}\n" + frame
+    return frame
@@ -0,0 +1,454 @@
+# subtitlarr/jobs.py
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+ACTIVE_STATES = ('queued', 'running', 'paused')
+# Finished jobs kept in memory for the /jobs API.
+HISTORY_SIZE = 20
+# Minimum time between two writes of the job state file while a job is running.
+SAVE_INTERVAL_SECONDS = 5
+
+
+class JobCancelled(Exception):
+    """Raised inside the download workers when their job has been cancelled."""
+
+
+class JobControl:
+    """
+    Shared between a Job and the download workers running it.
+
+    The workers call `wait()` before every video, which blocks while the job is paused and
+    raises JobCancelled once it has been cancelled, and `video_done()` after every video.
+    `done` holds the paths already processed, so a resumed job can skip them.
+    """
+
+    def __init__(self, done=None, on_progress=None):
+        self.done = set(done or ())
+        self.total = len(self.done)
+        self.saved_count = 0
+        self.cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._lock = threading.Lock()
+        self._on_progress = on_progress
+        # Throughput only counts the videos processed and the time spent in this process
+        self._session_completed = 0
+        self._active_seconds = 0.0
+        self._active_since = None
+
+    # --- Called by the job manager ---
+
+    def start(self):
+        with self._lock:
+            self._active_since = time.monotonic()
+
+    def stop(self):
+        with self._lock:
+            if self._active_since is not None:
+                self._active_seconds += time.monotonic() - self._active_since
+                self._active_since = None
+
+    def pause(self):
+        self._running.clear()
+        self.stop()
+
+    def resume(self):
+        self.start()
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        # Wake up the workers blocked on a paused job so they can stop
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    # --- Called by the download workers ---
+
+    def begin(self, pending):
+        """Sets the total once the run knows how many videos are still pending."""
+        with self._lock:
+            self.total = len(self.done) + pending
+
+    def extend(self, count):
+        """Adds the videos that arrived while the run was going to the total."""
+        with self._lock:
+            self.total += count
+
+    def is_done(self, path):
+        with self._lock:
+            return str(path) in self.done
+
+    def wait(self):
+        self._running.wait()
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def video_done(self, path, saved_count=0):
+        with self._lock:
+            self.done.add(str(path))
+            self.saved_count += saved_count
+            self._session_completed += 1
+        if self._on_progress is not None:
+            self._on_progress()
+
+    # --- Reporting ---
+
+    def progress(self):
+        """
+        Returns:
+            dict: Completed and total videos, throughput (videos per minute) and ETA in seconds.
+        """
+        with self._lock:
+            completed = len(self.done)
+            active = self._active_seconds
+            if self._active_since is not None:
+                active += time.monotonic() - self._active_since
+            rate = self._session_completed / active if active > 0 and self._session_completed else None
+            remaining = max(0, self.total - completed)
+            return {
+                'completed': completed,
+                'total': self.total,
+                'saved_count': self.saved_count,
+                'videos_per_minute': round(rate * 60, 1) if rate else None,
+                'eta_seconds': round(remaining / rate) if rate else None,
+            }
+
+
+class Job:
+    """A download run over one library, as tracked by the JobManager."""
+
+    def __init__(self, job_id, kind, library, params=None, created_at=None, done=None, on_progress=None):
+        self.id = job_id
+        self.kind = kind
+        self.library = library
+        self.params = dict(params or {})
+        self.created_at = created_at or time.time()
+        self.state = 'queued'
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self.resumed = bool(done)
+        self.control = JobControl(done, on_progress=on_progress)
+
+    def to_dict(self, include_done=False):
+        data = {
+            'id': self.id,
+            'kind': self.kind,
+            'library': list(self.library),
+            'params': self.params,
+            'state': self.state,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'resumed': self.resumed,
+        }
+        data.update(self.control.progress())
+        if include_done:
+            data['done'] = sorted(self.control.done)
+        return data
+
+
+class JobManager:
+    """
+    Runs download jobs in background threads, at most one per library.
+
+    Submitting the same kind of job with the same parameters as an active one, or a job for
+    a library that already has one queued, returns the existing job; otherwise, if the library
+    has a running (or paused) job, the new one waits for it to finish.
+    Active jobs, including the videos they already processed, are saved to `state_path`
+    so that `resume_pending()` can pick them up after a restart.
+
+    Args:
+        runner (callable): Called with the Job from its thread. Returns True if the run
+            succeeded; JobCancelled raised by `job.control.wait()` marks the job cancelled.
+        state_path (str, optional): JSON file where active jobs are persisted.
+    """
+
+    def __init__(self, runner, state_path=None):
+        self.runner = runner
+        self.state_path = state_path
+        self._jobs = {}
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        # Serialises the writes of the state file, which happen outside of _lock
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+        self._snapshots = 0
+        self._saved_snapshot = 0
+
+    @staticmethod
+    def library_key(paths):
+        return tuple(sorted(os.path.abspath(path) for path in paths))
+
+    def _new_job(self, kind, library, params=None, created_at=None, done=None):
+        job_id = next(self._ids)
+        while job_id in self._jobs:
+            job_id = next(self._ids)
+        job = Job(job_id, kind, library, params, created_at, done, on_progress=self._save_throttled)
+        self._jobs[job.id] = job
+        return job
+
+    def _active(self, library):
+        return [job for job in self._jobs.values() if job.library == library and job.state in ACTIVE_STATES]
+
+    def submit(self, paths, kind='manual', params=None):
+        """
+        Queues a job for the library made of `paths`.
+
+        Returns:
+            tuple: The Job, and False if an existing job was returned instead.
+        """
+        library = self.library_key(paths)
+        params = dict(params or {})
+        with self._lock:
+            active = self._active(library)
+            existing = [job for job in active if job.kind == kind and job.params == params]
+            existing += [job for job in active if job.state == 'queued']
+            if existing:
+                return existing[0], False
+            job = self._new_job(kind, library, params)
+            if not active:
+                self._start(job)
+            self.save()
+        return job, True
+
+    def _start(self, job):
+        job.state = 'running'
+        job.started_at = time.time()
+        job.control.start()
+        threading.Thread(target=self._run, args=(job,), name=f"subtitlarr-job-{job.id}", daemon=True).start()
+
+    def _run(self, job):
+        try:
+            succeeded = self.runner(job)
+            state, error = ('finished', None) if succeeded else ('failed', 'The run ended with errors.')
+        except JobCancelled:
+            state, error = 'cancelled', None
+        except Exception as e:
+            logging.exception(f"Job {job.id} failed")
+            state, error = 'failed', str(e)
+
+        with self._lock:
+            job.control.stop()
+            job.state, job.error = state, error
+            job.finished_at = time.time()
+            del self._jobs[job.id]
+            self._history.append(job)
+            # Next job queued for the same library, oldest first
+            queued = sorted((queued for queued in self._active(job.library) if queued.state == 'queued'),
+                            key=lambda queued: queued.id)
+            if queued:
+                self._start(queued[0])
+            self.save()
+
+    # --- Job control ---
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = next((old for old in self._history if old.id == job_id), None)
+            return job
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.state == 'queued':
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+                del self._jobs[job.id]
+                self._history.append(job)
+            else:
+                # The worker threads stop at the next video and _run records the state
+                job.control.cancel()
+            self.save()
+            return job
+
+    def pause(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != 'running':
+                return None
+            job.control.pause()
+            job.state = 'paused'
+            self.save()
+            return job
+
+    def resume(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != 'paused':
+                return None
+            job.state = 'running'
+            job.control.resume()
+            self.save()
+            return job
+
+    def snapshot(self):
+        """Returns the active jobs followed by the most recent finished ones, for the /jobs API."""
+        with self._lock:
+            active = sorted(self._jobs.values(), key=lambda job: job.id)
+            finished = sorted(self._history, key=lambda job: job.id, reverse=True)
+            return [job.to_dict() for job in active + finished]
+
+    # --- Persistence ---
+
+    def _save_throttled(self):
+        # Checked and saved under the lock so that concurrent progress callbacks save only once
+        with self._lock:
+            if time.monotonic() - self._last_save >= SAVE_INTERVAL_SECONDS:
+                self.save()
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            self._last_save = time.monotonic()
+            self._snapshots += 1
+            snapshot = self._snapshots
+            data = [job.to_dict(include_done=True) for job in sorted(self._jobs.values(), key=lambda job: job.id)]
+        tmp_path = self.state_path + '.tmp'
+        try:
+            with self._save_lock:
+                # A later snapshot may already have been written by another thread
+                if snapshot < self._saved_snapshot:
+                    return
+                with open(tmp_path, "w") as f:
+                    json.dump({'jobs': data}, f)
+                os.replace(tmp_path, self.state_path)
+                self._saved_snapshot = snapshot
+        except OSError as e:
+            logging.warning(f"Could not save job state to {self.state_path}: {e}")
+
+    def resume_pending(self):
+        """
+        Re-creates the jobs that were active when the process stopped and starts them,
+        skipping the videos they had already processed. Jobs that were paused stay paused.
+
+        Returns:
+            list: The restored jobs.
+        """
+        if not self.state_path or not os.path.exists(self.state_path):
+            return []
+        try:
+            with open(self.state_path, "r") as f:
+                saved = json.load(f).get('jobs', [])
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning(f"Could not load job state from {self.state_path}: {e}")
+            return []
+
+        restored = []
+        with self._lock:
+            for entry in sorted(saved, key=lambda entry: entry.get('id', 0)):
+                library = tuple(entry.get('library') or ())
+                if not library or self._active(library):
+                    continue
+                job = self._new_job(entry.get('kind', 'manual'), library, entry.get('params'),
+                                    entry.get('created_at'), entry.get('done'))
+                restored.append(job)
+                was_paused = entry.get('state') == 'paused'
+                if was_paused:
+                    # Paused before its thread starts, so it keeps the library busy without doing any work
+                    job.control.pause()
+                self._start(job)
+                if was_paused:
+                    job.state = 'paused'
+                    job.control.stop()
+            self.save()
+        for job in restored:
+            logging.info(f"Restored {job.state} job {job.id} ({job.kind}) with "
+                         f"{len(job.control.done)} video(s) already processed.")
+        return restored
+
+
+class ProgressFile:
+    """
+    The videos already processed by a batch backfill, persisted to `path` so that an
+    interrupted backfill can skip them when it is started again.
+
+    A file written for other search paths or languages is ignored.
+
+    Args:
+        path (str): JSON file to keep the progress in.
+        paths (list): Search paths of the backfill.
+        languages (list): Languages of the backfill.
+    """
+
+    def __init__(self, path, paths, languages):
+        self.path = path
+        self.key = {'paths': sorted(os.path.abspath(p) for p in paths), 'languages': sorted(languages)}
+        self.done = set()
+        self._lock = threading.Lock()
+        # Serialises the writes of the file: the collector thread and the final save can overlap
+        self._save_lock = threading.Lock()
+        self._last_save = 0.0
+        self._snapshots = 0
+        self._saved_snapshot = 0
+
+    def load(self):
+        """
+        Returns:
+            int: Number of videos already processed according to the file.
+        """
+        if not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not load backfill progress from {self.path}: {e}")
+            return 0
+        if not isinstance(saved, dict) or saved.get('key') != self.key:
+            logging.warning(f"Ignoring {self.path}: it was written for other search paths or languages.")
+            return 0
+        with self._lock:
+            self.done = set(saved.get('done', ()))
+            return len(self.done)
+
+    def add(self, video_path):
+        with self._lock:
+            self.done.add(str(video_path))
+            due = time.monotonic() - self._last_save >= SAVE_INTERVAL_SECONDS
+            if due:
+                # Claimed here so that only one of several concurrent adds saves
+                self._last_save = time.monotonic()
+        if due:
+            self.save()
+
+    def save(self):
+        with self._lock:
+            self._last_save = time.monotonic()
+            self._snapshots += 1
+            snapshot = self._snapshots
+            data = {'key': self.key, 'updated_at': time.time(), 'done': sorted(self.done)}
+        tmp_path = self.path + '.tmp'
+        try:
+            with self._save_lock:
+                # A later snapshot may already have been written by another thread
+                if snapshot < self._saved_snapshot:
+                    return
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+                self._saved_snapshot = snapshot
+        except OSError as e:
+            logging.warning(f"Could not save backfill progress to {self.path}: {e}")
+
+    def remove(self):
+        """Deletes the file once the backfill has finished."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
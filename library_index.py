@@ -0,0 +1,539 @@
+# subtitlarr/library_index.py
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from subtitle_inventory import SUBTITLE_EXTENSIONS
+
+# Directories modified this recently are re-listed on the next refresh, since coarse
+# filesystem timestamps (FAT, some SMB/NFS mounts) may hide a change made right after listing.
+MTIME_SETTLE_SECONDS = 2
+
+# A video in the library. `size`, `mtime` and `subtitles` (the subtitle file names in the
+# same directory) are None when the video was not read from the index and the disk must be checked.
+VideoFile = namedtuple('VideoFile', ['path', 'size', 'mtime', 'subtitles'])
+
+# Delay before searching again a video/language for which no subtitle was found,
+# indexed by the number of fruitless searches so far (capped at the last entry).
+SEARCH_BACKOFF_SECONDS = (3600, 6 * 3600, 24 * 3600, 7 * 24 * 3600)
+
+# Bumped when the stored listings change meaning; older indexes re-list every directory once.
+# 1: `subtitles` holds every SUBTITLE_EXTENSIONS file, not only .srt.
+SCHEMA_VERSION = 1
+
+# Most paths per query when looking up a list of videos.
+QUERY_CHUNK_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS directories (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    mtime_ns INTEGER,
+    subdirs TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS videos (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    indexed_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS subtitles (
+    directory TEXT NOT NULL,
+    root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (directory, name)
+);
+CREATE TABLE IF NOT EXISTS search_misses (
+    path TEXT NOT NULL,
+    language TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    next_search REAL NOT NULL,
+    PRIMARY KEY (path, language)
+);
+CREATE TABLE IF NOT EXISTS scanned_videos (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    providers TEXT NOT NULL,
+    video BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS embedded_subtitles (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    languages TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS videos_root ON videos (root);
+CREATE INDEX IF NOT EXISTS videos_directory ON videos (directory);
+CREATE INDEX IF NOT EXISTS subtitles_root ON subtitles (root);
+CREATE INDEX IF NOT EXISTS directories_root ON directories (root);
+"""
+
+
+def scan_directory(directory, video_extensions):
+    """
+    Lists a single directory with one os.scandir pass.
+
+    Args:
+        directory (str): Directory to list.
+        video_extensions (tuple): Lower-case video extensions; matching is case-insensitive.
+
+    Returns:
+        tuple: (videos, subtitles, subdirs) where `videos` is a list of (path, size, mtime),
+        `subtitles` the names of the subtitle files (SUBTITLE_EXTENSIONS) and `subdirs` the paths of the subdirectories.
+    """
+    videos, subtitles, subdirs = [], [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            lower = entry.name.lower()
+            if lower.endswith(video_extensions):
+                try:
+                    st = entry.stat()
+                except OSError as e:
+                    # A dangling symlink or a file removed mid-listing only skips that entry
+                    logging.warning(f"Could not read '{entry.path}': {e}")
+                    continue
+                videos.append((entry.path, st.st_size, st.st_mtime))
+            elif lower.endswith(SUBTITLE_EXTENSIONS):
+                subtitles.append(entry.name)
+    return videos, subtitles, subdirs
+
+
+def walk_videos(folders, video_extensions):
+    """
+    Streams the videos under `folders`, walking each tree once.
+
+    Yields:
+        VideoFile: One entry per video, with the subtitle names of its directory in `subtitles`.
+    """
+    video_extensions = tuple(ext.lower() for ext in video_extensions)
+    for folder in folders:
+        if not os.path.isdir(folder):
+            logging.warning(f"Search path '{folder}' does not exist or is not a directory, skipping.")
+            continue
+        stack = [os.fspath(folder)]
+        while stack:
+            directory = stack.pop()
+            try:
+                videos, subtitles, subdirs = scan_directory(directory, video_extensions)
+            except OSError as e:
+                logging.warning(f"Could not list '{directory}': {e}")
+                continue
+            stack.extend(reversed(sorted(subdirs)))
+            subtitles = frozenset(subtitles)
+            for path, size, mtime in sorted(videos):
+                yield VideoFile(Path(path), size, mtime, subtitles)
+
+
+def normalize_root(path):
+    """Returns the canonical form used to key a search path in the index."""
+    return os.path.normpath(os.path.abspath(path))
+
+
+class LibraryIndex:
+    """
+    Persistent SQLite index of the video files under the configured search paths.
+
+    Each directory is stored with its mtime; a refresh only re-lists directories whose
+    mtime changed (a file was added, removed or renamed in it), so a steady-state refresh
+    costs one stat per directory instead of a full walk per extension.
+    """
+
+    def __init__(self, db_path, video_extensions):
+        self.db_path = db_path
+        self.video_extensions = tuple(ext.lower() for ext in video_extensions)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(videos)")}
+            if 'indexed_at' not in columns:
+                self._conn.execute("ALTER TABLE videos ADD COLUMN indexed_at REAL NOT NULL DEFAULT 0")
+            if self._conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                self._conn.execute("UPDATE directories SET mtime_ns = NULL")
+                self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- Refresh ---
+
+    def refresh(self, roots, full=False):
+        """
+        Brings the index up to date for the given search paths.
+
+        Args:
+            roots (list): Search paths to refresh.
+            full (bool, optional): If True, re-lists every directory regardless of its mtime.
+
+        Returns:
+            dict: Number of directories visited and re-listed.
+        """
+        stats = {'directories': 0, 'rescanned': 0}
+        for root in roots:
+            for _ in self.iter_refresh(root, full, stats):
+                pass
+        return stats
+
+    def iter_refresh(self, root, full=False, stats=None):
+        """
+        Brings the index up to date for one search path, yielding each directory with videos
+        as soon as it is indexed, so that callers can stream results during the walk.
+
+        Directories that disappeared are only forgotten once the walk completes; if the caller
+        stops early they are left for the next refresh.
+
+        Args:
+            root (str): Search path to refresh.
+            full (bool, optional): If True, re-lists every directory regardless of its mtime.
+            stats (dict, optional): Counters updated in place, as returned by `refresh()`.
+
+        Yields:
+            tuple: (directory, videos) with the VideoFile entries of the directory, sorted by path.
+        """
+        if stats is None:
+            stats = {'directories': 0, 'rescanned': 0}
+        root = normalize_root(root)
+        if not os.path.isdir(root):
+            logging.warning(f"Search path '{root}' does not exist or is not a directory, skipping.")
+            return
+        with self._refresh_lock:
+            yield from self._refresh_root(root, full, stats)
+
+    def _refresh_root(self, root, full, stats):
+        with self._lock:
+            stored = {
+                path: (mtime_ns, subdirs)
+                for path, mtime_ns, subdirs in self._conn.execute(
+                    "SELECT path, mtime_ns, subdirs FROM directories WHERE root = ?", (root,)
+                )
+            }
+
+        seen = set()
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                continue
+            seen.add(directory)
+            stats['directories'] += 1
+
+            previous = stored.get(directory)
+            if not full and previous and previous[0] == mtime_ns:
+                stack.extend(reversed(sorted(json.loads(previous[1]))))
+                videos = self._directory_videos(directory)
+                if videos:
+                    yield directory, videos
+                continue
+
+            try:
+                videos, subtitles, subdirs = scan_directory(directory, self.video_extensions)
+            except OSError as e:
+                logging.warning(f"Could not list '{directory}': {e}")
+                continue
+            stats['rescanned'] += 1
+            stack.extend(reversed(sorted(subdirs)))
+
+            if time.time() - mtime_ns / 1e9 < MTIME_SETTLE_SECONDS:
+                mtime_ns = None
+            self._store_directory(root, directory, mtime_ns, videos, subtitles, subdirs)
+            if videos:
+                subtitles = frozenset(subtitles)
+                yield directory, [VideoFile(Path(path), size, mtime, subtitles) for path, size, mtime in sorted(videos)]
+
+        removed = set(stored) - seen
+        if removed:
+            self._forget_directories(removed)
+
+    def _store_directory(self, root, directory, mtime_ns, videos, subtitles, subdirs):
+        now = time.time()
+        with self._lock, self._conn:
+            # Keep the time a video was first indexed while it stays unchanged, so that
+            # videos(changed_since=...) only returns new or modified files.
+            known = {
+                path: (size, mtime, indexed_at)
+                for path, size, mtime, indexed_at in self._conn.execute(
+                    "SELECT path, size, mtime, indexed_at FROM videos WHERE directory = ?", (directory,)
+                )
+            }
+            rows = []
+            current = {path for path, _, _ in videos}
+            for path, size, mtime in videos:
+                previous = known.get(path)
+                indexed_at = previous[2] if previous and previous[:2] == (size, mtime) else now
+                rows.append((path, root, directory, size, mtime, indexed_at))
+
+            gone = [(path,) for path in set(known) - current]
+            self._conn.executemany("DELETE FROM scanned_videos WHERE path = ?", gone)
+            self._conn.executemany("DELETE FROM embedded_subtitles WHERE path = ?", gone)
+            self._conn.execute("DELETE FROM videos WHERE directory = ?", (directory,))
+            self._conn.execute("DELETE FROM subtitles WHERE directory = ?", (directory,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO videos (path, root, directory, size, mtime, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO subtitles (directory, root, name) VALUES (?, ?, ?)",
+                [(directory, root, name) for name in subtitles],
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO directories (path, root, mtime_ns, subdirs) VALUES (?, ?, ?, ?)",
+                (directory, root, mtime_ns, json.dumps(subdirs)),
+            )
+
+    def _directory_videos(self, directory):
+        with self._lock:
+            subtitles = frozenset(name for (name,) in self._conn.execute(
+                "SELECT name FROM subtitles WHERE directory = ?", (directory,)
+            ))
+            rows = self._conn.execute(
+                "SELECT path, size, mtime FROM videos WHERE directory = ? ORDER BY path", (directory,)
+            ).fetchall()
+        return [VideoFile(Path(path), size, mtime, subtitles) for path, size, mtime in rows]
+
+    def _forget_directories(self, directories):
+        rows = [(d,) for d in directories]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM search_misses WHERE path IN (SELECT path FROM videos WHERE directory = ?)", rows
+            )
+            self._conn.executemany(
+                "DELETE FROM scanned_videos WHERE path IN (SELECT path FROM videos WHERE directory = ?)", rows
+            )
+            self._conn.executemany(
+                "DELETE FROM embedded_subtitles WHERE path IN (SELECT path FROM videos WHERE directory = ?)", rows
+            )
+            self._conn.executemany("DELETE FROM videos WHERE directory = ?", rows)
+            self._conn.executemany("DELETE FROM subtitles WHERE directory = ?", rows)
+            self._conn.executemany("DELETE FROM directories WHERE path = ?", rows)
+
+    # --- Queries ---
+
+    def videos(self, roots, changed_since=None):
+        """
+        Returns the indexed videos under the given search paths.
+
+        Args:
+            roots (list): Search paths, as configured.
+            changed_since (float, optional): Only return videos added or modified after this timestamp.
+
+        Returns:
+            list: VideoFile entries whose `subtitles` holds the subtitle names found next to each video.
+        """
+        query = "SELECT path, directory, size, mtime FROM videos WHERE root = ? AND indexed_at > ? ORDER BY path"
+        results = []
+        with self._lock:
+            for root in roots:
+                root = normalize_root(root)
+                subtitles = {}
+                for directory, name in self._conn.execute(
+                    "SELECT directory, name FROM subtitles WHERE root = ?", (root,)
+                ):
+                    subtitles.setdefault(directory, set()).add(name)
+                for path, directory, size, mtime in self._conn.execute(query, (root, changed_since or -1)):
+                    results.append(VideoFile(Path(path), size, mtime, frozenset(subtitles.get(directory, ()))))
+        return results
+
+    # --- Checkpoints ---
+
+    def get_checkpoint(self, name):
+        """Returns the timestamp stored under `name`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_checkpoint(self, name, value):
+        """Stores a timestamp under `name` (e.g. the start of the last successful run)."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO checkpoints (name, value) VALUES (?, ?)", (name, value))
+
+    # --- Negative search results ---
+
+    def search_backoff(self, videos, now=None):
+        """
+        Returns the languages that should not be searched yet for each video.
+
+        A "nothing found" record only applies while the video keeps the size and mtime it
+        had when it was searched; a replaced or re-encoded file is searched again right away.
+
+        Args:
+            videos (list): VideoFile entries to check.
+            now (float, optional): Current timestamp, for testing.
+
+        Returns:
+            dict: Path (str) to the set of languages in backoff. Videos without any are omitted.
+        """
+        now = now or time.time()
+        wanted = {str(video.path): video for video in videos}
+        paths = list(wanted)
+        backoff = {}
+        with self._lock:
+            for start in range(0, len(paths), QUERY_CHUNK_SIZE):
+                chunk = paths[start:start + QUERY_CHUNK_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT path, language, size, mtime FROM search_misses "
+                    f"WHERE next_search > ? AND path IN ({', '.join('?' * len(chunk))})", [now] + chunk
+                ).fetchall()
+                for path, language, size, mtime in rows:
+                    video = wanted[path]
+                    if video.size != size or video.mtime != mtime:
+                        continue
+                    backoff.setdefault(path, set()).add(language)
+        return backoff
+
+    def record_search(self, video, searched, found, now=None):
+        """
+        Records the outcome of a provider search for a video.
+
+        Args:
+            video (VideoFile): The searched video; its size and mtime key the record.
+            searched (set): Languages that were searched for.
+            found (set): Languages for which a subtitle was saved.
+            now (float, optional): Current timestamp, for testing.
+        """
+        if video.size is None or video.mtime is None:
+            return
+        now = now or time.time()
+        path = str(video.path)
+        with self._lock, self._conn:
+            previous = {
+                language: (size, mtime, attempts)
+                for language, size, mtime, attempts in self._conn.execute(
+                    "SELECT language, size, mtime, attempts FROM search_misses WHERE path = ?", (path,)
+                )
+            }
+            self._conn.executemany(
+                "DELETE FROM search_misses WHERE path = ? AND language = ?",
+                [(path, language) for language in found],
+            )
+            misses = []
+            for language in set(searched) - set(found):
+                size, mtime, attempts = previous.get(language, (None, None, 0))
+                if size != video.size or mtime != video.mtime:
+                    attempts = 0
+                attempts += 1
+                delay = SEARCH_BACKOFF_SECONDS[min(attempts, len(SEARCH_BACKOFF_SECONDS)) - 1]
+                misses.append((path, language, video.size, video.mtime, attempts, now + delay))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO search_misses (path, language, size, mtime, attempts, next_search) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                misses,
+            )
+
+    # --- Scanned videos ---
+
+    def get_scanned_video(self, video):
+        """
+        Returns the subliminal Video stored for a file, if the file has not changed since.
+
+        Args:
+            video (VideoFile): The file; its size and mtime must match the stored ones.
+
+        Returns:
+            tuple: The Video and the set of providers its hashes were computed for, or None.
+        """
+        if video.size is None or video.mtime is None:
+            return None
+        path = str(video.path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime, providers, video FROM scanned_videos WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        size, mtime, providers, blob = row
+        if (size, mtime) != (video.size, video.mtime):
+            with self._lock, self._conn:
+                self._conn.execute("DELETE FROM scanned_videos WHERE path = ?", (path,))
+            return None
+        try:
+            return pickle.loads(blob), set(json.loads(providers))
+        except Exception as e:
+            # Written by another subliminal version, for instance
+            logging.debug(f"Discarding the stored scan of '{path}': {e}")
+            return None
+
+    def store_scanned_video(self, video, scanned, providers):
+        """
+        Stores the subliminal Video (with its hashes) of a file, keyed by its size and mtime.
+
+        Args:
+            video (VideoFile): The file.
+            scanned (subliminal.Video): Result of scan_video and the hash refiner.
+            providers (set): Providers the hashes were computed for.
+        """
+        if video.size is None or video.mtime is None:
+            return
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO scanned_videos (path, size, mtime, providers, video) VALUES (?, ?, ?, ?, ?)",
+                (str(video.path), video.size, video.mtime, json.dumps(sorted(providers)),
+                 pickle.dumps(scanned, protocol=pickle.HIGHEST_PROTOCOL)),
+            )
+
+    # --- Embedded subtitles ---
+
+    def get_embedded_languages(self, videos):
+        """
+        Returns the stored languages of the subtitle tracks inside the given videos.
+
+        Args:
+            videos (list): VideoFile entries; a stored result only applies while size and mtime match.
+
+        Returns:
+            dict: Path (str) to the frozenset of languages. Videos that were never probed, or changed
+            since, are omitted.
+        """
+        wanted = {str(video.path): video for video in videos if video.size is not None and video.mtime is not None}
+        paths = list(wanted)
+        languages = {}
+        with self._lock:
+            for start in range(0, len(paths), QUERY_CHUNK_SIZE):
+                chunk = paths[start:start + QUERY_CHUNK_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT path, size, mtime, languages FROM embedded_subtitles "
+                    f"WHERE path IN ({', '.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for path, size, mtime, stored in rows:
+                    video = wanted[path]
+                    if (size, mtime) == (video.size, video.mtime):
+                        languages[path] = frozenset(json.loads(stored))
+        return languages
+
+    def store_embedded_languages(self, entries):
+        """
+        Stores the languages of the subtitle tracks of videos, keyed by their size and mtime.
+
+        Args:
+            entries (list): (VideoFile, languages) pairs; an empty set records a video without tracks.
+        """
+        rows = [(str(video.path), video.size, video.mtime, json.dumps(sorted(languages)))
+                for video, languages in entries if video.size is not None and video.mtime is not None]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embedded_subtitles (path, size, mtime, languages) VALUES (?, ?, ?, ?)", rows
+            )
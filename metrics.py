@@ -0,0 +1,290 @@
+# subtitlarr/metrics.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Stages of a run, in pipeline order.
+STAGES = ('walk', 'prefilter', 'inventory', 'plan', 'hash', 'query', 'download', 'save')
+DEFAULT_HISTORY_SIZE = 50
+
+
+class RunMetrics:
+    """
+    Collects the timings and counters of one run_downloader call. Thread-safe.
+
+    Stage times are summed over all the worker threads, so with several workers the
+    per-video stages (hash, query, download, save) can add up to more than the wall time.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {stage: {'seconds': 0.0, 'count': 0} for stage in STAGES}
+        self.videos = {'listed': 0, 'too_small': 0, 'excluded': 0, 'up_to_date': 0, 'backed_off': 0,
+                       'arrived': 0, 'rejected': 0, 'searched': 0, 'with_new_subtitles': 0, 'errors': 0}
+        # Seconds between the arrival of a new video and its first saved subtitle
+        self.time_to_subtitle = []
+        self.providers = defaultdict(lambda: {'listed': 0, 'saved': 0})
+        self.languages = defaultdict(lambda: {'searched': 0, 'saved': 0})
+
+    @contextmanager
+    def stage(self, name):
+        """Adds the time spent inside the block to the stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'count': 0})
+            stage['seconds'] += seconds
+            stage['count'] += 1
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.videos[name] += amount
+
+    def record_video(self, languages, listed_subtitles=(), saved_subtitles=(), error=None):
+        """Records the outcome of the subtitle search of one video."""
+        with self._lock:
+            self.videos['searched'] += 1
+            if error is not None:
+                self.videos['errors'] += 1
+            if saved_subtitles:
+                self.videos['with_new_subtitles'] += 1
+            for language in languages:
+                self.languages[language]['searched'] += 1
+            for subtitle in listed_subtitles:
+                self.providers[subtitle.provider_name]['listed'] += 1
+            for subtitle in saved_subtitles:
+                self.providers[subtitle.provider_name]['saved'] += 1
+                self.languages[subtitle.language.alpha2]['saved'] += 1
+
+    def record_time_to_subtitle(self, seconds):
+        with self._lock:
+            self.time_to_subtitle.append(max(0.0, seconds))
+
+    def summary(self, **extra):
+        """
+        Returns:
+            dict: JSON-serializable summary of the run, with `extra` merged in.
+        """
+        duration = time.perf_counter() - self._start
+        with self._lock:
+            saved_count = sum(provider['saved'] for provider in self.providers.values())
+            summary = {
+                'started_at': self.started_at,
+                'finished_at': self.started_at + duration,
+                'duration_seconds': round(duration, 3),
+                'total_videos': self.videos['listed'] - self.videos['too_small'] - self.videos['excluded'],
+                'saved_count': saved_count,
+                'videos': dict(self.videos),
+                'stages': {name: {'seconds': round(stage['seconds'], 3), 'count': stage['count']}
+                           for name, stage in self.stages.items()},
+                'providers': {name: dict(counts) for name, counts in sorted(self.providers.items())},
+                'languages': {name: dict(counts) for name, counts in sorted(self.languages.items())},
+                'time_to_subtitle': _distribution(self.time_to_subtitle),
+            }
+        summary.update(extra)
+        return summary
+
+
+def _distribution(values):
+    """Count, sum, mean, median, 95th percentile and maximum of `values`, in seconds."""
+    values = sorted(values)
+    if not values:
+        return {'count': 0, 'sum_seconds': 0.0}
+
+    def percentile(share):
+        return round(values[min(len(values) - 1, int(share * len(values)))], 1)
+
+    return {'count': len(values), 'sum_seconds': round(sum(values), 1),
+            'avg_seconds': round(sum(values) / len(values), 1),
+            'p50_seconds': percentile(0.5), 'p95_seconds': percentile(0.95), 'max_seconds': round(values[-1], 1)}
+
+
+def format_summary(summary):
+    """One log line per stage, with its share of the total stage time."""
+    total = sum(stage['seconds'] for stage in summary['stages'].values()) or 1
+    lines = [f"Run took {summary['duration_seconds']:.1f}s: {summary['videos']['searched']} video(s) searched, "
+             f"{summary['saved_count']} subtitle(s) saved, {summary['videos']['errors']} error(s)."]
+    for name, stage in summary['stages'].items():
+        if stage['count']:
+            lines.append(f"  {name:<9} {stage['seconds']:>9.2f}s {stage['seconds'] / total:>6.1%} "
+                         f"({stage['count']} call(s), {stage['seconds'] / stage['count'] * 1000:.0f} ms each)")
+    latency = summary.get('time_to_subtitle', {})
+    if latency.get('count'):
+        lines.append(f"  Time to subtitle for {latency['count']} new video(s): median {latency['p50_seconds']:.0f}s, "
+                     f"p95 {latency['p95_seconds']:.0f}s, max {latency['max_seconds']:.0f}s.")
+    return "\n".join(lines)
+
+
+class RunHistory:
+    """
+    The summaries of the last `size` runs, persisted to `path`, plus counters accumulated
+    over all the runs since the process started (for the /metrics endpoint).
+    """
+
+    def __init__(self, path=None, size=DEFAULT_HISTORY_SIZE):
+        self.path = path
+        self.runs = deque(maxlen=size)
+        self.totals = {'runs': defaultdict(int), 'stages': defaultdict(lambda: {'seconds': 0.0, 'count': 0}),
+                       'videos': defaultdict(int), 'providers': defaultdict(lambda: defaultdict(int)),
+                       'languages': defaultdict(lambda: defaultdict(int)), 'saved': 0,
+                       'time_to_subtitle': {'count': 0, 'sum_seconds': 0.0}}
+        self._lock = threading.Lock()
+        # Serialises the writes of the history file, which happen outside of _lock
+        self._save_lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                runs = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not load run history from {self.path}: {e}")
+            return
+        with self._lock:
+            self.runs.extend(runs)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            runs = list(self.runs)
+        # Written to a temporary file first so that a crash never leaves a truncated history
+        tmp_path = self.path + ".tmp"
+        try:
+            with self._save_lock:
+                with open(tmp_path, "w") as f:
+                    json.dump(runs, f, indent=1)
+                os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Could not save run history to {self.path}: {e}")
+
+    def add(self, summary):
+        """Stores the summary of a finished run; `summary['status']` is finished, failed or cancelled."""
+        with self._lock:
+            self.runs.append(summary)
+            totals = self.totals
+            totals['runs'][summary.get('status', 'finished')] += 1
+            totals['saved'] += summary.get('saved_count', 0)
+            for name, stage in summary.get('stages', {}).items():
+                totals['stages'][name]['seconds'] += stage['seconds']
+                totals['stages'][name]['count'] += stage['count']
+            for name, value in summary.get('videos', {}).items():
+                totals['videos'][name] += value
+            for section in ('providers', 'languages'):
+                for name, counts in summary.get(section, {}).items():
+                    for counter, value in counts.items():
+                        totals[section][name][counter] += value
+            latency = summary.get('time_to_subtitle', {})
+            totals['time_to_subtitle']['count'] += latency.get('count', 0)
+            totals['time_to_subtitle']['sum_seconds'] += latency.get('sum_seconds', 0.0)
+        self.save()
+
+    def recent(self, limit=None):
+        with self._lock:
+            runs = list(self.runs)
+        runs.reverse()
+        return runs[:limit] if limit else runs
+
+    def prometheus(self, provider_stats=(), cache_stats=None, notification_stats=None):
+        """
+        Renders the accumulated counters in the Prometheus text exposition format.
+
+        Args:
+            provider_stats (list, optional): ProviderManager.snapshot().
+            cache_stats (dict, optional): core.cache_info().
+            notification_stats (dict, optional): NotificationDispatcher.metrics().
+        """
+        out = _PrometheusWriter()
+        with self._lock:
+            totals = self.totals
+            last = self.runs[-1] if self.runs else None
+            out.metric('subtitlarr_runs_total', 'counter', 'Runs finished since start, by status.',
+                       [({'status': status}, count) for status, count in sorted(totals['runs'].items())])
+            out.metric('subtitlarr_stage_seconds_total', 'counter', 'Time spent per pipeline stage (summed over workers).',
+                       [({'stage': name}, stage['seconds']) for name, stage in totals['stages'].items()])
+            out.metric('subtitlarr_stage_calls_total', 'counter', 'Number of times each pipeline stage ran.',
+                       [({'stage': name}, stage['count']) for name, stage in totals['stages'].items()])
+            out.metric('subtitlarr_videos_total', 'counter', 'Videos seen by the runs, by outcome.',
+                       [({'outcome': name}, value) for name, value in sorted(totals['videos'].items())])
+            out.metric('subtitlarr_subtitles_saved_total', 'counter', 'Subtitles saved since start.',
+                       [({}, totals['saved'])])
+            out.metric('subtitlarr_provider_subtitles_total', 'counter', 'Subtitles listed and saved per provider.',
+                       [({'provider': name, 'kind': counter}, value)
+                        for name, counts in sorted(totals['providers'].items())
+                        for counter, value in sorted(counts.items())])
+            out.metric('subtitlarr_language_videos_total', 'counter', 'Searches and saved subtitles per language.',
+                       [({'language': name, 'kind': counter}, value)
+                        for name, counts in sorted(totals['languages'].items())
+                        for counter, value in sorted(counts.items())])
+            out.metric('subtitlarr_time_to_subtitle_seconds_sum', 'counter',
+                       'Time from the arrival of a new video to its first saved subtitle, summed.',
+                       [({}, round(totals['time_to_subtitle']['sum_seconds'], 1))])
+            out.metric('subtitlarr_time_to_subtitle_seconds_count', 'counter',
+                       'New videos that got their first subtitle.',
+                       [({}, totals['time_to_subtitle']['count'])])
+            if last is not None:
+                out.metric('subtitlarr_last_run_timestamp_seconds', 'gauge', 'End of the last run.',
+                           [({}, last['finished_at'])])
+                out.metric('subtitlarr_last_run_duration_seconds', 'gauge', 'Wall time of the last run.',
+                           [({}, last['duration_seconds'])])
+                last_latency = last.get('time_to_subtitle', {})
+                if last_latency.get('count'):
+                    out.metric('subtitlarr_last_run_time_to_subtitle_seconds', 'gauge',
+                               'Time to subtitle of the new videos of the last run, by quantile.',
+                               [({'quantile': '0.5'}, last_latency['p50_seconds']),
+                                ({'quantile': '0.95'}, last_latency['p95_seconds'])])
+
+        provider_stats = list(provider_stats)
+        if provider_stats:
+            out.metric('subtitlarr_provider_latency_seconds', 'gauge', 'Smoothed latency per provider.',
+                       [({'provider': p['name']}, p['latency_ms'] / 1000) for p in provider_stats
+                        if p['latency_ms'] is not None])
+            out.metric('subtitlarr_provider_requests_total', 'counter', 'Requests sent per provider.',
+                       [({'provider': p['name'], 'kind': kind}, p[kind]) for p in provider_stats
+                        for kind in ('queries', 'downloads')])
+            out.metric('subtitlarr_provider_circuit_open', 'gauge', '1 while the circuit breaker of a provider is open.',
+                       [({'provider': p['name']}, int(p['state'] == 'open')) for p in provider_stats])
+        if cache_stats and 'hits' in cache_stats:
+            out.metric('subtitlarr_cache_requests_total', 'counter', 'Subliminal cache lookups.',
+                       [({'result': 'hit'}, cache_stats['hits']), ({'result': 'miss'}, cache_stats['misses'])])
+            out.metric('subtitlarr_cache_entries', 'gauge', 'Entries in the subliminal cache.',
+                       [({}, cache_stats['entries'])])
+        if notification_stats:
+            out.metric('subtitlarr_notifications_total', 'counter', 'Webhook deliveries, by result.',
+                       [({'result': result}, notification_stats[result])
+                        for result in ('sent', 'failed', 'retries', 'dropped')])
+        return out.text()
+
+
+class _PrometheusWriter:
+    def __init__(self):
+        self._lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        if not samples:
+            return
+        self._lines.append(f"# HELP {name} {help_text}")
+        self._lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+            self._lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    def text(self):
+        return "\n".join(self._lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
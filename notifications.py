@@ -1,10 +1,23 @@
 # subtitlarr/notifications.py
 import requests
 import logging
+import queue
+import threading
+import time
 
-def send_notification(webhook_url, message, title="Subtitlarr Notification", include_error=False):
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF_SECONDS = 2
+MAX_RETRY_DELAY_SECONDS = 60
+DEFAULT_DIGEST_INTERVAL_MINUTES = 15
+DEFAULT_QUEUE_SIZE = 1000
+# Videos listed by name in a digest (and kept in memory until it is sent); the rest are only counted.
+DIGEST_MAX_LINES = 15
+
+
+def build_payload(webhook_url, message, title="Subtitlarr Notification", include_error=False):
     """
-    Sends a notification to a webhook URL, attempting to auto-detect the type.
+    Builds the JSON body for a webhook, auto-detecting its type from the URL.
 
     Args:
         webhook_url (str): The URL of the webhook.
@@ -13,15 +26,8 @@ def send_notification(webhook_url, message, title="Subtitlarr Notification", inc
         include_error (bool, optional): If True, formats the message as an error.
 
     Returns:
-        bool: True if the notification was sent successfully, False otherwise.
+        dict: The payload for Discord, Slack or a generic webhook.
     """
-    if not webhook_url:
-        logging.warning("Webhook URL is not configured. Skipping notification.")
-        return False
-
-    headers = {"Content-Type": "application/json"}
-    payload = {}
-
     # --- Auto-detect Webhook Type ---
     if "discord.com" in webhook_url:
         # Discord Webhook
@@ -30,11 +36,11 @@ def send_notification(webhook_url, message, title="Subtitlarr Notification", inc
             "description": message,
             "color": 15158332 if include_error else 3066993  # Red for error, Green for success
         }
-        payload = {"embeds": [embed]}
+        return {"embeds": [embed]}
 
     elif "hooks.slack.com" in webhook_url:
         # Slack Webhook
-        payload = {
+        return {
             "attachments": [
                 {
                     "fallback": f"{title}: {message}",
@@ -46,13 +52,258 @@ def send_notification(webhook_url, message, title="Subtitlarr Notification", inc
         }
     else:
         # Generic Webhook (simple JSON)
-        payload = {"title": title, "message": message}
+        return {"title": title, "message": message}
+
+
+def send_notification(webhook_url, message, title="Subtitlarr Notification", include_error=False, session=None):
+    """
+    Sends a notification to a webhook URL, attempting to auto-detect the type.
+    Blocks until the webhook answers; background senders should use NotificationDispatcher.
+
+    Args:
+        webhook_url (str): The URL of the webhook.
+        message (str): The main content of the message.
+        title (str, optional): The title for the notification. Defaults to "Subtitlarr Notification".
+        include_error (bool, optional): If True, formats the message as an error.
+        session (requests.Session, optional): Session to reuse the connection with.
+
+    Returns:
+        bool: True if the notification was sent successfully, False otherwise.
+    """
+    if not webhook_url:
+        logging.warning("Webhook URL is not configured. Skipping notification.")
+        return False
+
+    headers = {"Content-Type": "application/json"}
+    payload = build_payload(webhook_url, message, title, include_error)
 
     try:
-        response = requests.post(webhook_url, json=payload, headers=headers, timeout=10)
+        response = (session or requests).post(webhook_url, json=payload, headers=headers, timeout=DEFAULT_TIMEOUT)
         response.raise_for_status()
         logging.info(f"Successfully sent notification to {webhook_url}")
         return True
     except requests.exceptions.RequestException as e:
         logging.error(f"Failed to send webhook notification: {e}")
-        return False
\ No newline at end of file
+        return False
+
+
+class NotificationDispatcher:
+    """
+    Sends webhook notifications from a background thread so callers never wait on the network.
+
+    Messages go through a bounded queue (the newest are dropped when it is full) and are
+    posted with a shared requests.Session. Failed deliveries (connection errors, timeouts,
+    HTTP 429 and 5xx) are retried with exponential backoff; other 4xx answers are not.
+
+    Per-video results recorded with `record_video()` are not sent one by one: they are
+    aggregated per webhook and sent as a single digest every `digest_interval_minutes`.
+    A digest only keeps the first DIGEST_MAX_LINES names of each kind plus the totals, and
+    `close()` sends the pending ones, so call it on shutdown.
+
+    Args:
+        session (requests.Session, optional): Session used for every request; a new one by default.
+        max_retries (int, optional): Retries after the first failed attempt.
+        retry_backoff_seconds (float, optional): Delay before the first retry, doubled on every retry.
+        digest_interval_minutes (float, optional): Time between two digests of the same webhook.
+        queue_size (int, optional): Maximum number of messages waiting to be sent.
+        timeout (float, optional): Timeout of every request, in seconds.
+    """
+
+    def __init__(self, session=None, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_backoff_seconds=DEFAULT_RETRY_BACKOFF_SECONDS,
+                 digest_interval_minutes=DEFAULT_DIGEST_INTERVAL_MINUTES,
+                 queue_size=DEFAULT_QUEUE_SIZE, timeout=DEFAULT_TIMEOUT):
+        self.session = session or requests.Session()
+        self.max_retries = max_retries
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.digest_interval = digest_interval_minutes * 60
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._digests = {}
+        self._lock = threading.Lock()
+        self._closing = threading.Event()
+        self._thread = None
+        self._metrics = {
+            'queued': 0, 'sent': 0, 'failed': 0, 'retries': 0, 'dropped': 0,
+            'digests': 0, 'videos_aggregated': 0,
+            'total_latency': 0.0, 'last_error': None, 'last_sent_at': None,
+        }
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._metrics[name] += amount
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._closing.clear()
+                self._thread = threading.Thread(target=self._run, name="subtitlarr-notifications", daemon=True)
+                self._thread.start()
+
+    # --- Producer API ---
+
+    def notify(self, webhook_url, message, title="Subtitlarr Notification", include_error=False):
+        """
+        Queues a notification and returns immediately.
+
+        Returns:
+            bool: False if the notification was dropped (no URL or queue full).
+        """
+        if not webhook_url:
+            logging.warning("Webhook URL is not configured. Skipping notification.")
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((webhook_url, message, title, include_error))
+        except queue.Full:
+            self._count('dropped')
+            logging.warning("Notification queue is full; dropping notification.")
+            return False
+        self._count('queued')
+        return True
+
+    def record_video(self, webhook_url, video_name, saved_count=0, error=None):
+        """Adds the result of one video to the next digest of `webhook_url`."""
+        if not webhook_url:
+            return
+        self._ensure_worker()
+        with self._lock:
+            digest = self._digests.get(webhook_url)
+            if digest is None:
+                digest = self._digests[webhook_url] = {
+                    'due': time.monotonic() + self.digest_interval, 'saved': [], 'errors': [], 'subtitles': 0,
+                    'saved_videos': 0, 'failed_videos': 0,
+                }
+            if error is not None:
+                digest['failed_videos'] += 1
+                if len(digest['errors']) < DIGEST_MAX_LINES:
+                    digest['errors'].append(f"{video_name}: {error}")
+            elif saved_count:
+                digest['saved_videos'] += 1
+                digest['subtitles'] += saved_count
+                if len(digest['saved']) < DIGEST_MAX_LINES:
+                    digest['saved'].append(video_name)
+            else:
+                return
+            self._metrics['videos_aggregated'] += 1
+
+    def flush_digests(self, force=True):
+        """Queues the pending digests (only those that are due unless `force`)."""
+        now = time.monotonic()
+        with self._lock:
+            due = [url for url, digest in self._digests.items() if force or digest['due'] <= now]
+            digests = [(url, self._digests.pop(url)) for url in due]
+        for url, digest in digests:
+            if digest['saved'] or digest['errors']:
+                self.notify(url, _format_digest(digest), title="📋 Subtitlarr Digest",
+                            include_error=bool(digest['errors']))
+                self._count('digests')
+
+    def wait_until_idle(self, timeout=None):
+        """
+        Blocks until every queued notification has been delivered or given up.
+
+        Returns:
+            bool: False if `timeout` expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=DEFAULT_TIMEOUT):
+        """Sends the pending digests, waits for the queue to drain and stops the worker."""
+        self.flush_digests()
+        self.wait_until_idle(timeout)
+        self._closing.set()
+
+    def metrics(self):
+        """Returns the delivery counters, for the UI."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            pending_videos = sum(d['saved_videos'] + d['failed_videos'] for d in self._digests.values())
+        attempts = metrics['sent'] + metrics['failed']
+        metrics['avg_latency_ms'] = round(metrics.pop('total_latency') / metrics['sent'] * 1000) if metrics['sent'] else None
+        metrics['success_rate'] = metrics['sent'] / attempts if attempts else None
+        metrics['pending'] = self._queue.qsize()
+        metrics['pending_digest_videos'] = pending_videos
+        return metrics
+
+    # --- Worker ---
+
+    def _run(self):
+        while not self._closing.is_set():
+            self.flush_digests(force=False)
+            try:
+                item = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                self._deliver(*item)
+            except Exception:
+                logging.exception("Unexpected error while sending a notification")
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, webhook_url, message, title, include_error):
+        payload = build_payload(webhook_url, message, title, include_error)
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count('retries')
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.post(webhook_url, json=payload, timeout=self.timeout)
+                if response.status_code < 400:
+                    with self._lock:
+                        self._metrics['sent'] += 1
+                        self._metrics['total_latency'] += time.perf_counter() - start
+                        self._metrics['last_sent_at'] = time.time()
+                    logging.info(f"Successfully sent notification to {webhook_url}")
+                    return True
+                error = f"HTTP {response.status_code}"
+                if response.status_code == 429:
+                    retry_after = _retry_after(response)
+                elif response.status_code < 500:
+                    # The request itself is wrong (bad URL, deleted webhook...); retrying will not help
+                    break
+            except requests.exceptions.RequestException as e:
+                error = str(e)
+
+            if attempt < self.max_retries:
+                delay = retry_after if retry_after is not None else self.retry_backoff_seconds * 2 ** attempt
+                logging.warning(f"Webhook notification failed ({error}); retrying in {delay:.0f}s.")
+                if self._closing.wait(min(delay, MAX_RETRY_DELAY_SECONDS)):
+                    break
+
+        with self._lock:
+            self._metrics['failed'] += 1
+            self._metrics['last_error'] = error
+        logging.error(f"Failed to send webhook notification: {error}")
+        return False
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _format_digest(digest):
+    lines = []
+    if digest['saved']:
+        lines.append(f"Downloaded {digest['subtitles']} subtitle(s) for {digest['saved_videos']} video(s):")
+        lines.extend(f"• {name}" for name in digest['saved'])
+        if digest['saved_videos'] > len(digest['saved']):
+            lines.append(f"… and {digest['saved_videos'] - len(digest['saved'])} more")
+    if digest['errors']:
+        if lines:
+            lines.append("")
+        lines.append(f"{digest['failed_videos']} video(s) failed:")
+        lines.extend(f"• {entry}" for entry in digest['errors'])
+        if digest['failed_videos'] > len(digest['errors']):
+            lines.append(f"… and {digest['failed_videos'] - len(digest['errors'])} more")
+    return "\n".join(lines)
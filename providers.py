@@ -0,0 +1,369 @@
+# subtitlarr/providers.py
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+import subliminal
+from subliminal.archives import ARCHIVE_ERRORS
+from subliminal.exceptions import DiscardingError
+from subliminal.utils import handle_exception
+
+# Requests per minute allowed per provider; providers not listed are not throttled.
+DEFAULT_RATE_LIMITS = {"opensubtitlescom": 40, "addic7ed": 10}
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN_MINUTES = 10
+
+# Weight of the latest sample in the moving average of the latency.
+LATENCY_SMOOTHING = 0.2
+
+COUNTERS = ('queries', 'hits', 'downloads', 'errors', 'total_latency')
+
+
+class ProvidersUnavailable(Exception):
+    """Raised when no provider could be queried: they all failed, were discarded or had their circuit open."""
+
+
+class ProviderManager:
+    """
+    Tracks the health of the subtitle providers and decides which ones to query.
+
+    For every provider it records latency, error rate and hit rate (queries that returned
+    at least one subtitle), enforces a requests-per-minute limit and opens a circuit breaker
+    after `failure_threshold` consecutive failures: the provider is skipped for
+    `cooldown_minutes`, then a single probe request decides whether it is closed again.
+
+    The counters are persisted to `state_path` so the provider order survives restarts.
+    Thread-safe; one instance is shared by all the download workers. Processes running
+    in parallel can share their rate limits through a SharedRateLimiter (`rate_limiter`).
+    """
+
+    def __init__(self, rate_limits=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown_minutes=DEFAULT_COOLDOWN_MINUTES, state_path=None, rate_limiter=None):
+        self.state_path = state_path
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        # Serialises the writes of the state file, which happen outside of _lock
+        self._save_lock = threading.Lock()
+        self._stats = {}
+        self._next_slot = {}
+        self.configure(rate_limits, failure_threshold, cooldown_minutes)
+        self.load()
+
+    def configure(self, rate_limits=None, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                  cooldown_minutes=DEFAULT_COOLDOWN_MINUTES):
+        """Applies the rate limits and circuit breaker settings from the configuration."""
+        with self._lock:
+            self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+            self.failure_threshold = max(1, int(failure_threshold))
+            self.cooldown_seconds = max(0.0, float(cooldown_minutes) * 60)
+
+    def _get(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {counter: 0 for counter in COUNTERS}
+            stats.update({'latency': None, 'consecutive_failures': 0, 'open_until': None,
+                          'probing': False, 'last_error': None})
+        return stats
+
+    # --- Persistence ---
+
+    def load(self):
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, "r") as f:
+                saved = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.warning(f"Could not load provider stats from {self.state_path}: {e}")
+            return
+        with self._lock:
+            for name, values in saved.items():
+                stats = self._get(name)
+                for counter in COUNTERS + ('latency',):
+                    if counter in values:
+                        stats[counter] = values[counter]
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            data = {
+                name: {counter: stats[counter] for counter in COUNTERS + ('latency',)}
+                for name, stats in self._stats.items()
+            }
+        # Written to a temporary file first so that a crash never leaves a truncated state file
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with self._save_lock:
+                with open(tmp_path, "w") as f:
+                    json.dump(data, f, indent=2)
+                os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logging.warning(f"Could not save provider stats to {self.state_path}: {e}")
+
+    # --- Circuit breaker and rate limiting ---
+
+    def allow(self, name, now=None):
+        """Returns False while the circuit of the provider is open."""
+        now = now or time.time()
+        with self._lock:
+            stats = self._get(name)
+            if stats['open_until'] is None:
+                return True
+            if now < stats['open_until'] or stats['probing']:
+                return False
+            # Half-open: let a single request through to test the provider
+            stats['probing'] = True
+            logging.info(f"Provider {name}: cooldown over, sending a probe request.")
+            return True
+
+    def acquire(self, name):
+        """Blocks until the rate limit of the provider allows one more request."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(name)
+            return
+        limit = self.rate_limits.get(name)
+        if not limit:
+            return
+        interval = 60.0 / float(limit)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(name, now))
+            self._next_slot[name] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def record(self, name, latency, kind='query', hits=0, error=None):
+        """
+        Records the outcome of a request to a provider.
+
+        Args:
+            name (str): Provider name.
+            latency (float): Duration of the request, in seconds.
+            kind (str, optional): 'query' (list subtitles) or 'download'.
+            hits (int, optional): Number of subtitles returned by a query.
+            error (Exception, optional): The error raised by the provider, if any.
+        """
+        with self._lock:
+            stats = self._get(name)
+            stats['queries' if kind == 'query' else 'downloads'] += 1
+            stats['total_latency'] += latency
+            if stats['latency'] is None:
+                stats['latency'] = latency
+            else:
+                stats['latency'] += LATENCY_SMOOTHING * (latency - stats['latency'])
+
+            if error is None:
+                if kind == 'query' and hits:
+                    stats['hits'] += 1
+                stats['consecutive_failures'] = 0
+                stats['open_until'] = None
+                stats['probing'] = False
+                return
+
+            stats['errors'] += 1
+            stats['consecutive_failures'] += 1
+            stats['last_error'] = f"{type(error).__name__}: {error}"
+            if stats['probing'] or stats['consecutive_failures'] >= self.failure_threshold:
+                stats['open_until'] = time.time() + self.cooldown_seconds
+                stats['probing'] = False
+                logging.warning(f"Provider {name}: circuit opened for {self.cooldown_seconds / 60:.0f} min "
+                                f"after {stats['consecutive_failures']} consecutive failure(s).")
+
+    # --- Ordering ---
+
+    def _score(self, name):
+        stats = self._get(name)
+        # Smoothed hit rate so that providers without history are neither favoured nor buried
+        hit_rate = (stats['hits'] + 1) / (stats['queries'] + 2)
+        error_rate = stats['errors'] / (stats['queries'] + stats['downloads'] + 1)
+        return hit_rate * (1 - error_rate) / (1 + (stats['latency'] or 0))
+
+    def plan(self, providers):
+        """
+        Orders the providers for a run, best first. Providers whose circuit is open are kept:
+        `allow()` skips them per request until their cooldown is over.
+
+        Returns:
+            list: The provider names, in the order TrackedProviderPool should query them.
+        """
+        with self._lock:
+            return sorted(providers, key=self._score, reverse=True)
+
+    def cooling_down(self, providers, now=None):
+        """Returns the providers whose circuit is open and still in its cooldown, without probing them."""
+        now = now or time.time()
+        with self._lock:
+            return [
+                name for name in providers
+                if self._get(name)['open_until'] is not None and self._get(name)['open_until'] > now
+            ]
+
+    def snapshot(self):
+        """Returns the stats of every known provider, for the UI."""
+        now = time.time()
+        with self._lock:
+            result = []
+            for name, stats in sorted(self._stats.items()):
+                requests = stats['queries'] + stats['downloads']
+                if stats['open_until'] is None:
+                    state = 'ok'
+                elif stats['open_until'] > now:
+                    state = 'open'
+                else:
+                    state = 'half-open'
+                result.append({
+                    'name': name,
+                    'state': state,
+                    'queries': stats['queries'],
+                    'downloads': stats['downloads'],
+                    'hit_rate': stats['hits'] / stats['queries'] if stats['queries'] else None,
+                    'error_rate': stats['errors'] / requests if requests else None,
+                    'latency_ms': round(stats['latency'] * 1000) if stats['latency'] is not None else None,
+                    'rate_limit_per_minute': self.rate_limits.get(name),
+                    'reopens_in_seconds': max(0, round(stats['open_until'] - now)) if state == 'open' else None,
+                    'last_error': stats['last_error'],
+                })
+            return result
+
+
+class SharedRateLimiter:
+    """
+    Requests-per-minute limits enforced across several processes.
+
+    The next free slot of every provider lives in shared memory, so the limit holds for the
+    sum of the requests of all the processes. It must be handed to the worker processes
+    when they are created (e.g. through a pool initializer), not sent to a running process.
+
+    Args:
+        rate_limits (dict, optional): Requests per minute per provider; DEFAULT_RATE_LIMITS by default.
+        context (multiprocessing context, optional): Context the worker processes are created with.
+    """
+
+    def __init__(self, rate_limits=None, context=None):
+        context = context or multiprocessing.get_context()
+        self.rate_limits = dict(DEFAULT_RATE_LIMITS if rate_limits is None else rate_limits)
+        self._lock = context.Lock()
+        self._next_slot = {name: context.Value('d', 0.0, lock=False) for name in self.rate_limits}
+
+    def acquire(self, name):
+        """Blocks until the rate limit of the provider allows one more request."""
+        limit = self.rate_limits.get(name)
+        if not limit:
+            return
+        interval = 60.0 / float(limit)
+        next_slot = self._next_slot[name]
+        # time.monotonic() is a system-wide clock, comparable between processes
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, next_slot.value)
+            next_slot.value = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class TrackedProviderPool(subliminal.ProviderPool):
+    """
+    subliminal ProviderPool that reports every provider request to a ProviderManager,
+    honours its rate limits and skips providers whose circuit is open.
+
+    The providers are queried one at a time in the order of `providers` (see
+    ProviderManager.plan), stopping as soon as every wanted language has a subtitle, so
+    lower-ranked providers are only queried for what the better ones did not find.
+
+    subliminal returns an empty list both when a provider has nothing and when it fails,
+    so the pool also keeps track of the outcome for the last video searched:
+    `answered_providers` were queried successfully, and `failed_providers` raised, were
+    discarded or were skipped by the circuit breaker (listing or downloading). Without a
+    manager only this tracking is done.
+    """
+
+    def __init__(self, providers=None, provider_configs=None, manager=None):
+        super().__init__(providers=providers, provider_configs=provider_configs)
+        self.manager = manager
+        self.answered_providers = set()
+        self.failed_providers = set()
+
+    def _record(self, name, start, **kwargs):
+        if self.manager is not None:
+            self.manager.record(name, time.perf_counter() - start, **kwargs)
+
+    def list_subtitles(self, video, languages):
+        """
+        Lists the subtitles of a video, provider by provider, until every language in `languages`
+        has at least one. Resets `answered_providers` and `failed_providers`.
+        """
+        self.answered_providers = set()
+        self.failed_providers = set()
+        subtitles = []
+        for name in self.providers:
+            if name in self.discarded_providers:
+                logging.debug(f"Skipping discarded provider {name}")
+                continue
+            provider_subtitles = self.list_subtitles_provider(name, video, languages)
+            if provider_subtitles is None:
+                logging.info(f"Discarding provider {name}")
+                self.discarded_providers.add(name)
+                continue
+            subtitles.extend(provider_subtitles)
+            if languages <= {subtitle.language for subtitle in subtitles}:
+                break
+        return subtitles
+
+    def list_subtitles_provider(self, provider, video, languages):
+        plugin = subliminal.provider_manager[provider].plugin
+        provider_languages = plugin.check_languages(languages)
+        if not plugin.check(video) or not provider_languages:
+            return super().list_subtitles_provider(provider, video, languages)
+
+        if self.manager is not None and not self.manager.allow(provider):
+            logging.debug(f"Skipping provider {provider}: circuit open")
+            self.failed_providers.add(provider)
+            return []
+
+        if self.manager is not None:
+            self.manager.acquire(provider)
+        start = time.perf_counter()
+        try:
+            subtitles = self[provider].list_subtitles(video, provider_languages)
+        except DiscardingError as e:
+            self._record(provider, start, error=e)
+            handle_exception(e, f'Provider {provider}')
+            self.failed_providers.add(provider)
+            return None
+        except Exception as e:
+            self._record(provider, start, error=e)
+            handle_exception(e, f'Provider {provider}')
+            self.failed_providers.add(provider)
+            return []
+
+        self._record(provider, start, hits=len(subtitles))
+        self.answered_providers.add(provider)
+        return subtitles
+
+    def download_subtitle(self, subtitle):
+        name = subtitle.provider_name
+        if name in self.discarded_providers or (self.manager is not None and not self.manager.allow(name)):
+            self.failed_providers.add(name)
+            return False
+
+        if self.manager is not None:
+            self.manager.acquire(name)
+        start = time.perf_counter()
+        try:
+            self[name].download_subtitle(subtitle)
+        except ARCHIVE_ERRORS:
+            self._record(name, start, kind='download')
+            logging.exception(f"Bad archive for subtitle {subtitle!r}")
+        except Exception as e:
+            self._record(name, start, kind='download', error=e)
+            handle_exception(e, f'Discarding provider {name}')
+            self.discarded_providers.add(name)
+            self.failed_providers.add(name)
+        else:
+            self._record(name, start, kind='download')
+
+        return subtitle.is_valid()
@@ -9,6 +9,13 @@ document.addEventListener('DOMContentLoaded', function() {
     const progressBar = document.getElementById('progress-bar');
     const progressLabel = document.getElementById('progress-label');
 
+    // Controles del trabajo en curso
+    const jobInfo = document.getElementById('job-info');
+    const pauseBtn = document.getElementById('pauseBtn');
+    const cancelBtn = document.getElementById('cancelBtn');
+    let currentJob = null;
+    let jobsTimer = null;
+
     // --- Funciones de Utilidad para la UI ---
     function log(message) {
         // Añade el mensaje al log con la hora actual
@@ -18,6 +25,12 @@ document.addEventListener('DOMContentLoaded', function() {
         logOutput.scrollTop = logOutput.scrollHeight;
     }
 
+    function appendLogEntry(entry) {
+        // Entradas del historial del servidor, que ya llevan su hora
+        logOutput.textContent += `\n${entry}`;
+        logOutput.scrollTop = logOutput.scrollHeight;
+    }
+
     function setActionsState(enabled) {
         // Activa o desactiva los botones de acción
         scanBtn.disabled = !enabled;
@@ -29,8 +42,113 @@ document.addEventListener('DOMContentLoaded', function() {
         progressContainer.classList.toggle('hidden', !visible);
     }
 
+    function formatRate(value) {
+        return value === null ? '-' : `${Math.round(value * 100)}%`;
+    }
+
+    function refreshProviderStats() {
+        // Pide las estadísticas de salud de los proveedores y rellena la tabla
+        fetch('/providers')
+            .then(response => response.json())
+            .then(data => {
+                const tbody = document.querySelector('#provider-stats tbody');
+                tbody.innerHTML = '';
+                if (data.providers.length === 0) {
+                    const row = tbody.insertRow();
+                    const cell = row.insertCell();
+                    cell.colSpan = 7;
+                    cell.textContent = 'No provider activity yet.';
+                    return;
+                }
+                data.providers.forEach(p => {
+                    const row = tbody.insertRow();
+                    let state = p.state;
+                    if (p.reopens_in_seconds !== null) {
+                        state += ` (${Math.ceil(p.reopens_in_seconds / 60)} min)`;
+                    }
+                    [
+                        p.name,
+                        state,
+                        p.queries,
+                        formatRate(p.hit_rate),
+                        formatRate(p.error_rate),
+                        p.latency_ms === null ? '-' : `${p.latency_ms} ms`,
+                        p.rate_limit_per_minute || '-'
+                    ].forEach(value => { row.insertCell().textContent = value; });
+                    if (p.last_error) {
+                        row.title = `Last error: ${p.last_error}`;
+                    }
+                    row.classList.toggle('provider-open', p.state === 'open');
+                });
+            })
+            .catch(error => log(`❌ Could not load provider stats: ${error}`));
+    }
+
+    function formatDuration(seconds) {
+        if (seconds === null) return '-';
+        const minutes = Math.floor(seconds / 60);
+        return minutes >= 60 ? `${Math.floor(minutes / 60)}h ${minutes % 60}m` : `${minutes}m ${seconds % 60}s`;
+    }
+
+    // --- Trabajos de Descarga ---
+    function showJob(job) {
+        currentJob = job;
+        if (!job) {
+            jobInfo.textContent = '';
+            return;
+        }
+        const speed = job.videos_per_minute === null ? '-' : `${job.videos_per_minute} videos/min`;
+        jobInfo.textContent = `Job #${job.id} (${job.kind}) ${job.state} · ${speed} · ETA ${formatDuration(job.eta_seconds)}`;
+        pauseBtn.textContent = job.state === 'paused' ? '▶️ Resume' : '⏸️ Pause';
+        pauseBtn.disabled = job.state === 'queued';
+    }
+
+    function refreshJobs() {
+        // Consulta /jobs mientras haya un trabajo activo (también tras recargar la página)
+        fetch('/jobs')
+            .then(response => response.json())
+            .then(data => {
+                const active = data.jobs.find(job => ['running', 'paused', 'queued'].includes(job.state));
+                showJob(active || null);
+                if (active) {
+                    setActionsState(false);
+                    showProgress(true);
+                    jobsTimer = setTimeout(refreshJobs, 2000);
+                } else {
+                    jobsTimer = null;
+                }
+            })
+            .catch(error => log(`❌ Could not load jobs: ${error}`));
+    }
+
+    function watchJobs() {
+        if (jobsTimer === null) {
+            refreshJobs();
+        }
+    }
+
+    function jobAction(action) {
+        if (!currentJob) return;
+        fetch(`/jobs/${currentJob.id}/${action}`, { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success) {
+                    showJob(data.job);
+                } else {
+                    log(`❌ ${data.error}`);
+                }
+            })
+            .catch(error => log(`❌ Connection error: ${error}`));
+    }
+
+    pauseBtn.addEventListener('click', () => jobAction(currentJob && currentJob.state === 'paused' ? 'resume' : 'pause'));
+    cancelBtn.addEventListener('click', () => jobAction('cancel'));
+
     // --- Conexión a Server-Sent Events (SSE) ---
-    const source = new EventSource('/stream');
+    // Solo pedimos los logs posteriores a los que ya vienen renderizados en la página;
+    // al reconectar, el navegador envía Last-Event-ID y el servidor reenvía lo perdido.
+    const lastEventId = logOutput.dataset.lastEventId || '0';
+    const source = new EventSource(`/stream?since=${lastEventId}`);
 
     source.onmessage = function(event) {
         const data = JSON.parse(event.data);
@@ -39,6 +157,9 @@ document.addEventListener('DOMContentLoaded', function() {
             case 'log':
                 log(data.message);
                 break;
+            case 'replay':
+                appendLogEntry(data.message);
+                break;
             case 'progress':
                 const [current, total] = data.message.split('/');
                 progressBar.value = current;
@@ -50,14 +171,22 @@ document.addEventListener('DOMContentLoaded', function() {
                     log('✅ Task finished.');
                     setActionsState(true);
                     showProgress(false);
+                    refreshProviderStats();
+                    // Puede haber otro trabajo en cola para la misma biblioteca
+                    watchJobs();
                 }
                 break;
         }
     };
 
+    refreshProviderStats();
+    watchJobs();
+
     source.onerror = function() {
-        log('❌ Server connection lost. Please refresh the page.');
-        source.close();
+        // EventSource reconecta solo; no cerramos la conexión para no perder eventos
+        if (source.readyState === EventSource.CONNECTING) {
+            log('⚠️ Server connection lost. Reconnecting...');
+        }
     };
 
     // --- Lógica de la Interfaz (Botones y Formularios) ---
@@ -103,8 +232,18 @@ document.addEventListener('DOMContentLoaded', function() {
             languages: Array.from(document.querySelectorAll('.lang-input')).map(input => input.value.trim()).filter(Boolean),
             schedule_enabled: document.getElementById('schedule-enabled').checked,
             schedule_interval_minutes: parseInt(document.getElementById('schedule-interval').value),
+            incremental_schedule: document.getElementById('incremental-schedule').checked,
+            full_scan_interval_hours: parseInt(document.getElementById('full-scan-interval').value),
             min_file_size_mb: parseInt(document.getElementById('min-file-size').value),
+            exclude_patterns: document.getElementById('exclude-patterns').value.split(',').map(p => p.trim()).filter(Boolean),
             max_concurrent_workers: parseInt(document.getElementById('max-workers').value),
+            download_priority: document.getElementById('download-priority').value,
+            arrival_check_minutes: parseFloat(document.getElementById('arrival-check').value),
+            probe_embedded_subtitles: document.getElementById('probe-embedded').checked,
+            cache_path: document.getElementById('cache-path').value.trim(),
+            cache_backend: document.getElementById('cache-backend').value,
+            cache_max_entries: parseInt(document.getElementById('cache-max-entries').value),
+            cache_ttl_hours: parseFloat(document.getElementById('cache-ttl').value),
             credentials: {
                 opensubtitles: {
                     username: document.getElementById('opensubtitles-user').value,
@@ -127,7 +266,9 @@ document.addEventListener('DOMContentLoaded', function() {
                 notify_on_completion: document.getElementById('notify-completion').checked,
                 notify_on_errors: document.getElementById('notify-errors').checked,
                 include_errors: document.getElementById('include-error-details').checked,
-                webhook_type: "auto"
+                webhook_type: "auto",
+                send_digest: document.getElementById('send-digest').checked,
+                digest_interval_minutes: parseFloat(document.getElementById('digest-interval').value)
             }
         };
 
@@ -153,24 +294,116 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Cache de subliminal: estadísticas y compactación
+    const cacheInfo = document.getElementById('cache-info');
+
+    function formatBytes(bytes) {
+        return bytes > 1048576 ? `${(bytes / 1048576).toFixed(1)} MB` : `${Math.round(bytes / 1024)} KB`;
+    }
+
+    function refreshCacheInfo() {
+        fetch('/cache')
+            .then(response => response.json())
+            .then(info => {
+                if (info.entries === undefined) {
+                    cacheInfo.textContent = info.backend ? `Backend: ${info.backend}` : '';
+                    return;
+                }
+                const hitRate = info.hit_rate === null ? '-' : `${Math.round(info.hit_rate * 100)}%`;
+                cacheInfo.textContent = `${info.entries} entries, ${formatBytes(info.bytes_on_disk)}, hit rate ${hitRate}`;
+            })
+            .catch(() => { cacheInfo.textContent = ''; });
+    }
+
+    document.getElementById('compact-cache').addEventListener('click', () => {
+        cacheInfo.textContent = 'Compacting...';
+        fetch('/cache/compact', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    throw new Error(data.error);
+                }
+                log(`🧹 Cache compacted: ${data.removed} entries removed, ${formatBytes(data.bytes_before)} → ${formatBytes(data.bytes_after)}`);
+                refreshCacheInfo();
+            })
+            .catch(error => {
+                cacheInfo.textContent = `❌ ${error.message}`;
+            });
+    });
+
+    refreshCacheInfo();
+
     // Escanear Estado
+    // /scan responde NDJSON: una línea por carpeta según se escanea y un resumen al final
+    const formatMissing = missing => Object.entries(missing)
+        .filter(([, count]) => count)
+        .map(([lang, count]) => `${lang}: ${count}`)
+        .join(', ') || 'none';
+
+    const logScanRecord = record => {
+        if (record.type === 'error') {
+            log(`   Path: ${record.root} - ❗ ERROR: ${record.error}`);
+        } else if (record.type === 'directory') {
+            log(`   📁 ${record.directory} - Videos: ${record.videos}, Missing: ${formatMissing(record.missing)}`);
+        } else if (record.type === 'summary') {
+            log(`✅ Scan complete: ${record.directories} folder(s) in ${record.elapsed_seconds}s.`);
+            record.roots.filter(res => !res.error).forEach(res => {
+                log(`   Path: ${res.path}`);
+                log(`    Videos: ${res.videos}, Missing: ${res.missing}`);
+                const skipped = res.skipped || {};
+                if (skipped.too_small || skipped.excluded) {
+                    log(`    Skipped: ${skipped.too_small} too small, ${skipped.excluded} excluded`);
+                }
+                if (res.backoff) {
+                    log(`    Waiting to retry (no subtitles found recently): ${res.backoff}`);
+                }
+            });
+            const incomplete = record.shows.filter(entry => Object.values(entry.missing).some(count => count));
+            if (incomplete.length) {
+                log('   Missing subtitles by show:');
+                incomplete.forEach(entry => {
+                    const name = entry.show === null ? 'Movies' : `${entry.show} - Season ${entry.season}`;
+                    log(`    ${name} (${entry.videos} video(s)): ${formatMissing(entry.missing)}`);
+                });
+            }
+            if (record.has_more) {
+                log(`   More folders available (next offset: ${record.offset + record.limit}).`);
+            }
+        }
+    };
+
     scanBtn.addEventListener('click', () => {
         log('▶️ Starting status scan...');
         setActionsState(false);
-        fetch('/scan', { method: 'POST' })
-            .then(response => response.json())
-            .then(data => {
-                log('✅ Scan complete. Results:');
-                data.results.forEach(res => {
-                    if (res.error) {
-                        log(`   Path: ${res.path} - ❗ ERROR: ${res.error}`);
-                    } else {
-                        log(`   Path: ${res.path}`);
-                        log(`    Videos: ${res.videos}, Missing: ${res.missing}`);
-                    }
-                });
+        const params = new URLSearchParams();
+        const show = document.getElementById('scan-show').value.trim();
+        const languages = document.getElementById('scan-languages').value.trim();
+        if (show) params.set('show', show);
+        if (languages) params.set('language', languages);
+        if (document.getElementById('scan-missing-only').checked) params.set('missing_only', 'true');
+
+        fetch('/scan?' + params.toString(), { method: 'POST' })
+            .then(async response => {
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error || response.statusText);
+                }
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
+                    const lines = buffer.split('\n');
+                    buffer = lines.pop();
+                    lines.filter(line => line.trim()).forEach(line => logScanRecord(JSON.parse(line)));
+                }
+                if (buffer.trim()) {
+                    logScanRecord(JSON.parse(buffer));
+                }
             })
-            .catch(error => log(`❌ Connection error: ${error}`))
+            .catch(error => log(`❌ Connection error: ${error.message || error}`))
             .finally(() => setActionsState(true));
     });
 
@@ -184,6 +417,14 @@ document.addEventListener('DOMContentLoaded', function() {
         progressLabel.textContent = "0/0";
 
         fetch('/download', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.created || data.job.state === 'queued') {
+                    log(`ℹ️ ${data.message}`);
+                }
+                showJob(data.job);
+                watchJobs();
+            })
             .catch(error => log(`❌ Error starting task: ${error}`));
     });
 });
\ No newline at end of file
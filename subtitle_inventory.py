@@ -0,0 +1,151 @@
+# subtitlarr/subtitle_inventory.py
+import logging
+import os
+from functools import lru_cache
+
+from babelfish import Language
+
+try:
+    import enzyme
+except ImportError:  # installed with subliminal (through knowit), but only needed to probe MKV files
+    enzyme = None
+else:
+    # enzyme logs every element it parses at INFO level
+    logging.getLogger('enzyme').setLevel(logging.WARNING)
+
+# Sidecar formats recognised next to a video. .idx/.sub are VobSub pairs, .sup is PGS.
+SUBTITLE_EXTENSIONS = ('.srt', '.ass', '.ssa', '.vtt', '.sub', '.idx', '.sup', '.smi')
+
+# Containers whose subtitle tracks can be read from the headers (enzyme only parses Matroska).
+EMBEDDED_EXTENSIONS = ('.mkv', '.mka', '.webm')
+
+# Tokens that may follow the language in a sidecar name, e.g. "Movie.en.forced.srt", "Movie.en.sdh.srt".
+SUBTITLE_FLAGS = frozenset({'forced', 'foreign', 'sdh', 'hi', 'cc', 'default', 'full'})
+
+# Most trailing tokens (language and flags) looked at in a sidecar name.
+MAX_SUFFIX_TOKENS = 3
+
+
+@lru_cache(maxsize=1024)
+def language_code(token):
+    """
+    Converts a language tag found in a file name or a track header to an ISO 639-1 code.
+
+    Accepts IETF tags ("en", "pt-BR"), ISO 639-2 codes ("eng", "ger", "fre") and English names ("English").
+
+    Returns:
+        str: The two-letter code, or None if `token` is not a language (or has no two-letter code, like "und").
+    """
+    if not token or not token[0].isalpha():
+        return None
+    converters = [Language.fromietf]
+    if len(token) == 3:
+        converters.append(Language.fromalpha3b)
+    elif len(token) > 3:
+        converters.append(Language.fromname)
+    for converter in converters:
+        try:
+            language = converter(token if converter is Language.fromietf else token.lower())
+            return language.alpha2
+        except Exception:
+            continue
+    return None
+
+
+def _suffix_language(tokens):
+    """
+    Returns (is_suffix, language) for the tokens between a video stem and the extension.
+    The first token is read as a language before a flag, so "Movie.hi.srt" is Hindi while
+    "Movie.en.hi.srt" is a hearing-impaired English subtitle.
+    """
+    language = None
+    for position, token in enumerate(tokens):
+        lower = token.lower()
+        if position and lower in SUBTITLE_FLAGS:
+            continue
+        code = language_code(token)
+        if code is None:
+            if lower not in SUBTITLE_FLAGS:
+                return False, None
+        elif language is None:
+            language = code
+    return True, language
+
+
+@lru_cache(maxsize=4096)
+def sidecar_languages(names):
+    """
+    Indexes the subtitle files of a directory by the video stem they can belong to.
+
+    "Movie.2019.en.forced.ass" is recorded for "movie.2019" as English, and also for
+    "movie.2019.en.forced" and "movie.2019.en" as a subtitle without a language, since the
+    name alone does not say where the video stem ends. Results are cached per set of names.
+
+    Args:
+        names (frozenset): File names in the directory; non-subtitle names are ignored.
+
+    Returns:
+        dict: Lower-case stem to the frozenset of language codes, with None for a subtitle without one.
+    """
+    stems = {}
+    for name in names:
+        base, extension = os.path.splitext(name)
+        if extension.lower() not in SUBTITLE_EXTENSIONS:
+            continue
+        parts = base.lower().split('.')
+        stems.setdefault(base.lower(), set()).add(None)
+        for split in range(len(parts) - 1, max(0, len(parts) - 1 - MAX_SUFFIX_TOKENS), -1):
+            is_suffix, language = _suffix_language(parts[split:])
+            if not is_suffix:
+                break
+            stems.setdefault('.'.join(parts[:split]), set()).add(language)
+    return {stem: frozenset(languages) for stem, languages in stems.items()}
+
+
+def present_languages(video_path, subtitle_names, languages):
+    """
+    Returns the wanted languages that already have a sidecar subtitle next to a video.
+
+    A subtitle without a language in its name ("Movie.srt") is counted as the first wanted language,
+    the one players pick it up as.
+
+    Args:
+        video_path (Path): The video.
+        subtitle_names (frozenset): Subtitle file names in its directory, or None to list the directory.
+        languages (list): Wanted language codes, in order of preference.
+
+    Returns:
+        set: The languages of `languages` that are present.
+    """
+    if subtitle_names is None:
+        try:
+            subtitle_names = frozenset(name for name in os.listdir(video_path.parent)
+                                       if name.lower().endswith(SUBTITLE_EXTENSIONS))
+        except OSError:
+            subtitle_names = frozenset()
+    found = sidecar_languages(subtitle_names).get(video_path.stem.lower(), frozenset())
+    present = {lang for lang in languages if (language_code(lang) or lang) in found}
+    if None in found and languages:
+        present.add(languages[0])
+    return present
+
+
+def probe_embedded_languages(video_path):
+    """
+    Reads the languages of the subtitle tracks of a Matroska file from its headers, without
+    reading the media data. Tracks without a language tag are ignored.
+
+    Returns:
+        frozenset: Language codes of the embedded subtitle tracks; empty for other containers,
+        unreadable files or when enzyme is not installed.
+    """
+    if enzyme is None or not str(video_path).lower().endswith(EMBEDDED_EXTENSIONS):
+        return frozenset()
+    try:
+        with open(video_path, 'rb') as f:
+            mkv = enzyme.MKV(f)
+    except Exception as e:
+        logging.debug(f"Could not read the subtitle tracks of '{video_path}': {e}")
+        return frozenset()
+    codes = (language_code(track.language) for track in mkv.subtitle_tracks if track.enabled)
+    return frozenset(code for code in codes if code)
@@ -0,0 +1,94 @@
+# subtitlarr/work_queue.py
+import heapq
+import itertools
+import threading
+
+# Order in which the pending videos of a run are searched:
+#   newest:           most recently added (or modified) first
+#   oldest:           least recently added first
+#   fewest_languages: videos with the fewest wanted subtitles already on disk first, newest first among them
+#   path:             alphabetical, the order of the library walk
+PRIORITIES = ('newest', 'oldest', 'fewest_languages', 'path')
+DEFAULT_PRIORITY = 'newest'
+
+
+def arrival_time(video_file):
+    """
+    When a video arrived in the library, taken from its mtime (the time the download or copy
+    finished). The index's `indexed_at` is not used: the first refresh gives the same time to
+    every video already in the library.
+
+    Returns:
+        float: Timestamp, or 0 if unknown.
+    """
+    return video_file.mtime or 0
+
+
+def priority_key(priority, video_file, missing_languages):
+    """
+    Sort key of a pending video; smaller keys are searched first.
+
+    Raises:
+        ValueError: If `priority` is not one of PRIORITIES.
+    """
+    if priority == 'newest':
+        return (-arrival_time(video_file),)
+    if priority == 'oldest':
+        return (arrival_time(video_file),)
+    if priority == 'fewest_languages':
+        return (-len(missing_languages), -arrival_time(video_file))
+    if priority == 'path':
+        return (str(video_file.path),)
+    raise ValueError(f"Unknown priority '{priority}'; expected one of: {', '.join(PRIORITIES)}.")
+
+
+class WorkQueue:
+    """
+    Thread-safe priority queue of the (VideoFile, missing languages) pairs of a run.
+
+    Videos added with `arrived=True` (found while the run was already going) are served
+    before the whole backlog, whatever the priority. A path is only ever queued once per run,
+    so re-discovering a video that is queued or already processed is a no-op.
+
+    Args:
+        priority (str, optional): One of PRIORITIES.
+    """
+
+    def __init__(self, priority=DEFAULT_PRIORITY):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'; expected one of: {', '.join(PRIORITIES)}.")
+        self.priority = priority
+        self._heap = []
+        self._seen = set()
+        # Tie-breaker so that equal keys keep their insertion order
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+
+    def put(self, video_file, missing_languages, arrived=False):
+        """
+        Returns:
+            bool: False if the video had already been queued in this run.
+        """
+        key = priority_key(self.priority, video_file, missing_languages)
+        path = str(video_file.path)
+        with self._lock:
+            if path in self._seen:
+                return False
+            self._seen.add(path)
+            heapq.heappush(self._heap, (0 if arrived else 1, key, next(self._order), video_file, missing_languages))
+        return True
+
+    def get(self):
+        """
+        Returns:
+            tuple: The next (VideoFile, missing languages), or None if the queue is empty.
+        """
+        with self._lock:
+            if not self._heap:
+                return None
+            entry = heapq.heappop(self._heap)
+        return entry[3], entry[4]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._heap)